@@ -2,8 +2,9 @@ from django.contrib import admin
 from django.urls import path
 from django.shortcuts import redirect
 from .models import (
-    Category, Product, ProductImage, ProductVariant, Cart, CartItem,
-    Order, OrderItem, ProductReview, Wishlist, WishlistItem, Coupon, UserProfile
+    Category, Product, ProductImage, ProductVariant, Cart, CartItem, InventoryHold,
+    Order, OrderItem, ProductReview, Wishlist, WishlistItem, Coupon, UserProfile,
+    DailySales, DailyProductSales, HourlySales, HourlyProductSales,
 )
 from .customer_views import (
     customer_catalog, product_detail_customer, customer_cart,
@@ -20,9 +21,9 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'base_price', 'is_active', 'created_at']
+    list_display = ['name', 'sku', 'category', 'base_price', 'is_active', 'created_at']
     list_filter = ['category', 'is_active', 'created_at']
-    search_fields = ['name', 'description']
+    search_fields = ['name', 'sku', 'description']
     ordering = ['-created_at']
 
 @admin.register(ProductImage)
@@ -33,30 +34,110 @@ class ProductImageAdmin(admin.ModelAdmin):
     
 @admin.register(ProductVariant)
 class ProductVariantAdmin(admin.ModelAdmin):
-    list_display = ['product', 'name', 'sku', 'final_price', 'inventory_count', 'is_active']
+    list_display = ['product', 'name', 'sku', 'final_price', 'on_hand', 'reserved_count', 'stock_shards', 'is_active']
     list_filter = ['is_active', 'created_at']
     search_fields = ['name', 'sku']
     ordering = ['product', 'name']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('shards')
+
+    def get_readonly_fields(self, request, obj=None):
+        # Sharded stock is set with catalog.inventory.set_stock or the API
+        if obj is not None and obj.is_sharded:
+            return ['inventory_count']
+        return []
+
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ['user', 'total_items', 'total_price', 'created_at']
+    list_display = ['user', 'item_count', 'subtotal', 'created_at']
     list_filter = ['created_at']
     search_fields = ['user__username']
+    list_select_related = ['user']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+
+    @admin.display(description='Total items', ordering='item_count')
+    def item_count(self, obj):
+        return obj.item_count
+
+    @admin.display(description='Total price', ordering='subtotal')
+    def subtotal(self, obj):
+        return obj.subtotal
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'variant', 'quantity', 'total_price', 'added_at']
     list_filter = ['added_at']
     search_fields = ['cart__user__username', 'variant__name']
+    list_select_related = ['cart__user', 'variant__product']
+
+@admin.register(InventoryHold)
+class InventoryHoldAdmin(admin.ModelAdmin):
+    # Holds are managed by catalog.inventory; editing them here would put
+    # ProductVariant.reserved_count out of step
+    list_display = ['cart', 'variant', 'quantity', 'expires_at', 'created_at']
+    list_filter = ['expires_at']
+    search_fields = ['cart__user__username', 'variant__sku']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 # Additional Admin Models
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['order_number', 'user', 'status', 'total_amount', 'payment_status', 'created_at']
+    list_display = ['order_number', 'user', 'status', 'total_amount', 'coupon', 'payment_status', 'created_at']
     list_filter = ['status', 'payment_status', 'created_at']
     search_fields = ['order_number', 'user__username']
-    readonly_fields = ['order_number', 'created_at', 'updated_at']
+    readonly_fields = ['order_number', 'coupon', 'discount_amount', 'created_at', 'updated_at']
+    list_select_related = ['user', 'coupon']
+
+class ReadOnlyRollupAdmin(admin.ModelAdmin):
+    # Rollups are maintained by catalog.rollups; use rollup_sales --rebuild
+    # to recompute them
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(DailySales)
+class DailySalesAdmin(ReadOnlyRollupAdmin):
+    list_display = ['date', 'order_count', 'units', 'revenue']
+    date_hierarchy = 'date'
+    ordering = ['-date']
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(ReadOnlyRollupAdmin):
+    list_display = ['date', 'product', 'order_count', 'units', 'revenue']
+    list_select_related = ['product']
+    date_hierarchy = 'date'
+    ordering = ['-date', '-revenue']
+    search_fields = ['product__name']
+
+@admin.register(HourlySales)
+class HourlySalesAdmin(ReadOnlyRollupAdmin):
+    list_display = ['hour', 'order_count', 'units', 'revenue']
+    date_hierarchy = 'hour'
+    ordering = ['-hour']
+
+@admin.register(HourlyProductSales)
+class HourlyProductSalesAdmin(ReadOnlyRollupAdmin):
+    list_display = ['hour', 'product', 'order_count', 'units', 'revenue']
+    list_select_related = ['product']
+    date_hierarchy = 'hour'
+    ordering = ['-hour', '-revenue']
+    search_fields = ['product__name']
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -84,7 +165,7 @@ class WishlistItemAdmin(admin.ModelAdmin):
 
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
-    list_display = ['code', 'discount_type', 'discount_value', 'is_active', 'used_count', 'valid_until']
+    list_display = ['code', 'discount_type', 'discount_value', 'is_active', 'used_count', 'max_uses', 'valid_until']
     list_filter = ['discount_type', 'is_active', 'valid_from', 'valid_until']
     search_fields = ['code', 'description']
     readonly_fields = ['used_count', 'created_at']
@@ -0,0 +1,220 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import (
+    BooleanField, Case, Count, DateField, F, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import TruncDate, TruncHour, TruncWeek
+from django.utils import timezone
+
+from .models import (
+    Category, DailyProductSales, DailySales, HourlyProductSales, HourlySales, Order, OrderItem, Product,
+)
+from .rollups import net_line_revenue
+
+# Sales time series for the admin dashboard.
+#
+# Points are read from the hourly and daily rollups (catalog.rollups), so a
+# year by day is at most 366 rows per series whatever the order volume.
+# Orders not rolled up yet (normally only the last few seconds' worth) are
+# added from one query over just those orders.
+
+HOUR, DAY, WEEK = 'hour', 'day', 'week'
+INTERVALS = [HOUR, DAY, WEEK]
+
+# Breakdowns: the series key in the product rollups and in OrderItem
+GROUPS = {
+    'product': ('product', 'variant__product'),
+    'category': ('product__category', 'variant__product__category'),
+}
+
+COUNTERS = ['order_count', 'units', 'revenue']
+
+
+def max_buckets():
+    return getattr(settings, 'CATALOG_TIMESERIES_MAX_BUCKETS', 10000)
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time()))
+
+
+def bucket_range(interval, start, end):
+    """
+    The aware datetimes bounding the whole `interval` buckets that
+    [start, end) overlaps, in the current time zone; weeks start on Monday.
+    """
+    start, end = timezone.localtime(start), timezone.localtime(end)
+    if interval == HOUR:
+        lower = start.replace(minute=0, second=0, microsecond=0)
+        upper = end.replace(minute=0, second=0, microsecond=0)
+        return lower, upper if upper == end else upper + timedelta(hours=1)
+    first, last = start.date(), end.date()
+    if end != _midnight(last):
+        last += timedelta(days=1)
+    if interval == WEEK:
+        first -= timedelta(days=first.weekday())
+        last += timedelta(days=-last.weekday() % 7)
+    return _midnight(first), _midnight(last)
+
+
+def bucket_count(interval, lower, upper):
+    if interval == HOUR:
+        return int((upper - lower).total_seconds() // 3600)
+    days = (upper.date() - lower.date()).days
+    return days // 7 if interval == WEEK else days
+
+
+def _rolled_up(interval, lower, upper, group, products):
+    """Rollup rows grouped by bucket (and `group`), with the counters summed"""
+    by_product = group is not None or products is not None
+    if interval == HOUR:
+        model = HourlyProductSales if by_product else HourlySales
+        field, low, high = 'hour', lower, upper
+    else:
+        model = DailyProductSales if by_product else DailySales
+        field, low, high = 'date', lower.date(), upper.date()
+    rows = model.objects.filter(**{f'{field}__gte': low, f'{field}__lt': high})
+    if products is not None:
+        rows = rows.filter(product__in=products)
+    keys = [GROUPS[group][0]] if group else []
+    return (
+        rows.annotate(bucket=TruncWeek(field) if interval == WEEK else F(field))
+        .values('bucket', *keys)
+        .annotate(order_count=Sum('order_count'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by()
+    ), keys[0] if keys else None
+
+
+def _pending(interval, lower, upper, group, products):
+    """The same rows for the orders in range that are not rolled up yet, in one query"""
+    if interval == HOUR:
+        truncate = lambda field: TruncHour(field)
+    elif interval == DAY:
+        truncate = lambda field: TruncDate(field)
+    else:
+        truncate = lambda field: TruncWeek(field, output_field=DateField())
+
+    if group is None and products is None:
+        units = (
+            OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+            .values('order').annotate(units=Sum('quantity')).values('units')
+        )
+        return (
+            Order.objects.filter(is_rolled_up=False, created_at__gte=lower, created_at__lt=upper)
+            .annotate(bucket=truncate('created_at'), order_units=Subquery(units))
+            .values('bucket')
+            .annotate(order_count=Count('pk'), units=Sum('order_units'), revenue=Sum('total_amount'))
+            .order_by()
+        ), None
+
+    # Every line of those orders, to split each order's total across them as
+    # the rollups do (catalog.rollups.net_line_revenue)
+    lines = OrderItem.objects.filter(
+        order__is_rolled_up=False, order__created_at__gte=lower, order__created_at__lt=upper,
+    ).annotate(bucket=truncate('order__created_at'), product=F('variant__product'))
+    if products is not None:
+        lines = lines.annotate(counted=Case(
+            When(variant__product__in=products, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ))
+    key = GROUPS[group][1] if group else None
+    lines = lines.values(
+        'order', 'bucket', 'product', 'price', 'quantity', 'order__total_amount',
+        *([key] if key else []), *(['counted'] if products is not None else []),
+    ).order_by('order', 'pk')
+
+    rows = {}
+    for line, revenue in net_line_revenue(lines):
+        if products is not None and not line['counted']:
+            continue
+        series_key = line[key] if key else None
+        row = rows.setdefault((line['bucket'], series_key), {
+            'bucket': line['bucket'], key: series_key, 'orders': set(), 'units': 0, 'revenue': 0,
+        })
+        # Orders per product, like the product rollups
+        row['orders'].add((line['order'], line['product']))
+        row['units'] += line['quantity']
+        row['revenue'] += revenue
+    for row in rows.values():
+        row['order_count'] = len(row.pop('orders'))
+    return rows.values(), key
+
+
+def _format(interval, bucket):
+    if interval == HOUR:
+        return timezone.localtime(bucket).isoformat()
+    return bucket.isoformat()
+
+
+def sales_timeseries(interval, start, end, group=None, product=None, category=None, limit=10):
+    """
+    Orders, units and revenue per `interval` bucket over [start, end),
+    widened to whole buckets: one series of totals, or with `group`
+    ('product' or 'category') the `limit` series with the most revenue.
+    `product` and `category` (including subcategories) restrict the sales
+    counted. Buckets with no sales are left out.
+
+    Revenue is as charged, after coupon discounts; broken down, or
+    restricted to some products, each line gets its share of its order's
+    total, so the series add up to the totals. There, order counts are per
+    product: a category's counts an order once for each of its products in
+    the category.
+    """
+    lower, upper = bucket_range(interval, start, end)
+
+    products = None
+    if product is not None:
+        products = Product.objects.filter(pk=product).values('pk')
+    elif category is not None:
+        products = Product.objects.in_category(category).values('pk')
+
+    series = {}
+    for rows, key in (
+        _rolled_up(interval, lower, upper, group, products),
+        _pending(interval, lower, upper, group, products),
+    ):
+        for row in rows:
+            points = series.setdefault(row[key] if key else None, {})
+            point = points.setdefault(row['bucket'], dict.fromkeys(COUNTERS, 0))
+            for counter in COUNTERS:
+                point[counter] += row[counter] or 0
+
+    totals = {
+        series_key: {counter: sum(point[counter] for point in points.values()) for counter in COUNTERS}
+        for series_key, points in series.items()
+    }
+    keys = sorted(series, key=lambda series_key: totals[series_key]['revenue'], reverse=True)[:limit]
+    if group == 'product':
+        names = dict(Product.objects.filter(pk__in=keys).values_list('pk', 'name'))
+    elif group == 'category':
+        names = dict(Category.objects.filter(pk__in=keys).values_list('pk', 'name'))
+    else:
+        names = {}
+
+    def counters(values):
+        return {
+            'order_count': values['order_count'],
+            'units': values['units'],
+            'revenue': float(values['revenue']),
+        }
+
+    return {
+        'interval': interval,
+        'start': timezone.localtime(lower).isoformat(),
+        'end': timezone.localtime(upper).isoformat(),
+        'group_by': group,
+        'series': [
+            {
+                'key': series_key,
+                'name': names.get(series_key, 'All' if group is None else None),
+                'totals': counters(totals[series_key]),
+                'points': [
+                    {'bucket': _format(interval, bucket), **counters(point)}
+                    for bucket, point in sorted(series[series_key].items())
+                ],
+            }
+            for series_key in keys
+        ],
+    }
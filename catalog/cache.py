@@ -0,0 +1,133 @@
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+# Cached public responses are keyed on the request path, the normalized query
+# string and the current values of the version keys the response depends on.
+# Writes bump versions (see catalog.signals) instead of deleting entries, so
+# invalidation is precise and stale entries simply age out.
+#
+# Versions are microsecond timestamps of the last change. They expire with
+# the cached responses (CATALOG_CACHE_TIMEOUT), so even a cache that is not
+# shared by every worker serves a stale response for at most that long.
+
+VERSION_PREFIX = 'catalog:version:'
+RESPONSE_PREFIX = 'catalog:response:'
+
+
+def product_version(product_id):
+    return f'product:{product_id}'
+
+
+def category_version(category_id):
+    return f'category:{category_id}'
+
+
+def cart_version(user_id):
+    return f'cart:{user_id}'
+
+
+PRODUCTS_VERSION = 'products'
+CATEGORIES_VERSION = 'categories'
+COUPONS_VERSION = 'coupons'
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def _version_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def get_versions(names):
+    """Current version of each name, initializing any that are missing"""
+    keys = {name: VERSION_PREFIX + name for name in names}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for name, key in keys.items():
+        if key not in found:
+            # Unknown (never bumped, or evicted): start a new version so no
+            # entry cached under an older one can be served
+            cache.add(key, _now(), _version_timeout())
+            found[key] = cache.get(key)
+        versions[name] = found[key]
+    return versions
+
+
+def bump_versions(*names):
+    now = _now()
+    cache.set_many({VERSION_PREFIX + name: now for name in names}, _version_timeout())
+
+
+def normalized_params(request):
+    return sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+        if value != ''
+    )
+
+
+def response_cache_key(request, versions):
+    raw = repr((
+        request.get_host(), request.path, normalized_params(request), sorted(versions.items())
+    ))
+    return RESPONSE_PREFIX + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cached_get(request, version_names, render, timeout=None):
+    """Serve `render()` from the cache for GET requests; only 200s are stored"""
+    if request.method not in ('GET', 'HEAD'):
+        return render()
+
+    if timeout is None:
+        timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+    key = response_cache_key(request, get_versions(version_names))
+    data = cache.get(key)
+    if data is not None:
+        return Response(data, headers={'X-Cache': 'HIT'})
+
+    response = render()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+    return response
+
+
+def cache_response(version_names, timeout=None):
+    """
+    Decorator for function views. `version_names(request, **kwargs)` returns
+    the version keys the response depends on.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            return cached_get(
+                request,
+                version_names(request, **kwargs),
+                lambda: view(request, *args, **kwargs),
+                timeout=timeout,
+            )
+        return wrapped
+    return decorator
+
+
+class CachedResponseMixin:
+    """Cache GET responses of a generic view; override get_cache_versions()"""
+    cache_timeout = None
+
+    def get_cache_versions(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        return cached_get(
+            request,
+            self.get_cache_versions(),
+            lambda: super(CachedResponseMixin, self).get(request, *args, **kwargs),
+            timeout=self.cache_timeout,
+        )
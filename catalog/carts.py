@@ -0,0 +1,238 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import Case, PositiveIntegerField, Prefetch, Value, When
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import serializers
+
+from . import inventory
+from .db import bulk_increment_or_create, increment_or_create
+from .models import Cart, CartItem, ProductVariant
+from .signals import cart_changed
+
+# Cart line operations accepted by apply_operations()
+ADD, SET, REMOVE = 'add', 'set', 'remove'
+OPERATIONS = [ADD, SET, REMOVE]
+
+
+def _changed(cart):
+    # Once committed, so a cached summary is never rebuilt from the old lines
+    user_id = cart.user_id
+    transaction.on_commit(lambda: cart_changed.send(sender=Cart, user_id=user_id))
+
+
+class Unavailable(serializers.ValidationError):
+    """Some variants are inactive or short of stock; their ids are in `variant_ids`"""
+
+    def __init__(self, variant_ids):
+        super().__init__({
+            'operations': [f'Variant {variant_id} is unavailable or has insufficient inventory'
+                           for variant_id in variant_ids]
+        })
+        self.variant_ids = variant_ids
+
+
+def _fold(current, operations):
+    """Final quantity of each variant that [(operation, variant id, quantity)] changes"""
+    target = {}
+    for operation, variant_id, quantity in operations:
+        existing = target.get(variant_id, current.get(variant_id, 0))
+        if operation == ADD:
+            target[variant_id] = existing + quantity
+        elif operation == SET:
+            target[variant_id] = quantity
+        else:
+            target[variant_id] = 0
+    return {
+        variant_id: quantity for variant_id, quantity in target.items()
+        if quantity != current.get(variant_id, 0)
+    }
+
+
+class DraftCart:
+    """
+    A cart that is not in the database: an anonymous visitor's, kept in a
+    signed cookie by catalog.middleware.AnonymousCartMiddleware until they
+    log in, or the still empty cart of a user. Reads like a Cart for
+    CartSerializer and the templates and writes nothing.
+    """
+    id = pk = created_at = updated_at = None
+    SALT = 'catalog.carts.DraftCart'
+
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        self.changed = False
+
+    @classmethod
+    def from_cookie(cls, value, max_age=None):
+        """The cart a signed cookie holds; empty if it is missing, tampered with or expired"""
+        if not value:
+            return cls()
+        try:
+            return cls({variant_id: quantity for variant_id, quantity in
+                        signing.loads(value, salt=cls.SALT, max_age=max_age)})
+        except (signing.BadSignature, TypeError, ValueError):
+            return cls()
+
+    def to_cookie(self):
+        return signing.dumps(sorted(self.lines.items()), salt=self.SALT, compress=True)
+
+    def apply_operations(self, operations):
+        """
+        Same contract as apply_operations() for the lines in the cookie.
+        Nothing is held, so stock is only checked, in one query.
+        """
+        changes = _fold(self.lines, operations)
+        if not changes:
+            return
+        lines = {variant_id: quantity for variant_id, quantity in {**self.lines, **changes}.items() if quantity}
+        if len(lines) > getattr(settings, 'CATALOG_ANONYMOUS_CART_LINES', 50):
+            raise serializers.ValidationError({'operations': 'Too many different items in the cart'})
+
+        added = {variant_id: quantity for variant_id, quantity in changes.items() if quantity}
+        available = {
+            variant.pk: variant.available_count
+            for variant in ProductVariant.objects.filter(pk__in=added, is_active=True).prefetch_related('shards')
+        }
+        short = [variant_id for variant_id, quantity in added.items() if available.get(variant_id, 0) < quantity]
+        if short:
+            raise Unavailable(short)
+
+        self.lines = lines
+        self.changed = True
+        self.__dict__.pop('items', None)
+
+    @cached_property
+    def items(self):
+        variants = (
+            ProductVariant.objects.select_related('product').prefetch_related('shards')
+            .filter(pk__in=self.lines, is_active=True)
+        )
+        return [CartItem(variant=variant, quantity=self.lines[variant.pk]) for variant in variants]
+
+    @property
+    def total_items(self):
+        return sum(item.quantity for item in self.items)
+
+    @property
+    def total_price(self):
+        return sum((item.total_price for item in self.items), Decimal('0'))
+
+
+def cart_with_totals(user, related=('variant__product',)):
+    """
+    The user's cart with totals annotated and its lines loaded with
+    `related` and their variants' stock shards, in three queries; an empty
+    DraftCart if they have none yet, so that viewing a cart never writes.
+    """
+    items = CartItem.objects.select_related(*related).prefetch_related('variant__shards')
+    cart = (
+        Cart.objects.with_totals()
+        .prefetch_related(Prefetch('items', queryset=items))
+        .filter(user=user).first()
+    )
+    return cart if cart is not None else DraftCart()
+
+
+def merge(cart, lines):
+    """
+    Add a DraftCart's lines ({variant id: quantity}) to a user's cart with
+    apply_operations(): one set of line writes and one batch of holds. Lines
+    no longer available are dropped; returns their variant ids.
+    """
+    dropped = []
+    while lines:
+        try:
+            apply_operations(cart, [(ADD, variant_id, quantity) for variant_id, quantity in lines.items()])
+        except Unavailable as unavailable:
+            dropped += unavailable.variant_ids
+            lines = {
+                variant_id: quantity for variant_id, quantity in lines.items()
+                if variant_id not in unavailable.variant_ids
+            }
+        else:
+            break
+    return dropped
+
+
+def add_item(cart, variant_id, quantity):
+    """
+    Add `quantity` units of a variant to a cart and return the cart line.
+
+    Takes no lock: the line and the hold are each one upsert adding to what
+    is there and the stock is one conditional UPDATE, so concurrent adds to
+    the same line all count without retrying. Raises ValidationError,
+    changing nothing, if the variant is inactive or short of stock.
+    """
+    with transaction.atomic():
+        item = increment_or_create(
+            CartItem,
+            {'cart_id': cart.pk, 'variant_id': variant_id, 'quantity': quantity, 'added_at': timezone.now()},
+            unique_fields=['cart', 'variant'],
+            increment_fields=['quantity'],
+        )
+        if not inventory.hold_more(cart, variant_id, quantity):
+            raise serializers.ValidationError({'quantity': 'Insufficient inventory'})
+        _changed(cart)
+    return item
+
+
+def set_item(cart, variant_id, quantity):
+    """Set a cart line's quantity, removing it at 0; see apply_operations()"""
+    apply_operations(cart, [(SET if quantity > 0 else REMOVE, variant_id, quantity)])
+
+
+def apply_operations(cart, operations):
+    """
+    Apply [(operation, variant id, quantity)] to a cart in one transaction.
+
+    Operations are folded into the final quantity per variant first, so the
+    lines are written with one statement per kind of change and the holds for
+    every changed line are taken together (catalog.inventory). Raises
+    Unavailable, changing nothing, if any variant is inactive or short.
+    """
+    with transaction.atomic():
+        inventory.lock_cart(cart)
+        current = dict(
+            CartItem.objects.select_for_update().filter(cart=cart).values_list('variant_id', 'quantity')
+        )
+
+        changes = _fold(current, operations)
+        if not changes:
+            return
+
+        # Lines before holds, the order add_item() writes them in
+        removed = [variant_id for variant_id, quantity in changes.items() if not quantity]
+        if removed:
+            CartItem.objects.filter(cart=cart, variant_id__in=removed).delete()
+        updated = {
+            variant_id: quantity for variant_id, quantity in changes.items()
+            if quantity and variant_id in current
+        }
+        if updated:
+            CartItem.objects.filter(cart=cart, variant_id__in=updated).update(
+                quantity=Case(
+                    *[When(variant_id=variant_id, then=Value(quantity)) for variant_id, quantity in updated.items()],
+                    output_field=PositiveIntegerField(),
+                )
+            )
+        # New lines are added to, not overwritten, should add_item() insert
+        # the same one meanwhile
+        now = timezone.now()
+        bulk_increment_or_create(
+            CartItem,
+            [
+                {'cart_id': cart.pk, 'variant_id': variant_id, 'quantity': quantity, 'added_at': now}
+                for variant_id, quantity in changes.items() if quantity and variant_id not in current
+            ],
+            unique_fields=['cart', 'variant'],
+            increment_fields=['quantity'],
+        )
+
+        short = inventory.reserve_many(cart, changes)
+        if short:
+            raise Unavailable(short)
+        _changed(cart)
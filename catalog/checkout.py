@@ -0,0 +1,190 @@
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+
+from . import rollups
+from .coupons import coupons, redeem
+from .inventory import decrement_stock
+from .models import Cart, CartItem, InventoryHold, InventoryShard, Order, OrderItem, ProductVariant
+from .signals import cart_changed, stock_changed
+
+
+def generate_order_number():
+    return f"ORD-{uuid.uuid4().hex[:8].upper()}"
+
+
+def place_order(user, coupon_code=None, **order_fields):
+    """
+    Turn the user's cart into an order.
+
+    Runs in one transaction with a fixed number of queries however large the
+    cart is: the variants are locked in id order (so concurrent checkouts of
+    overlapping carts queue instead of deadlocking), stock is taken in a
+    single conditional UPDATE that also consumes the cart's holds, order
+    items are bulk inserted and the cart is emptied. A coupon is redeemed
+    with one conditional UPDATE (catalog.coupons). Raises ValidationError,
+    leaving nothing changed, if the cart is empty, any variant is inactive
+    or short of stock, or the coupon does not apply or has run out.
+    """
+    with transaction.atomic():
+        # Same lock order as catalog.inventory: cart, lines, holds, variants.
+        # Lines or holds added concurrently after these reads are left in
+        # the cart rather than deleted unpaid for.
+        Cart.objects.select_for_update().filter(user=user).exists()
+        quantities = dict(
+            CartItem.objects.select_for_update().filter(cart__user=user).values_list('variant_id', 'quantity')
+        )
+        if not quantities:
+            raise serializers.ValidationError({'cart': 'Cart is empty'})
+        held = dict(
+            InventoryHold.objects.select_for_update().filter(cart__user=user).values_list('variant_id', 'quantity')
+        )
+
+        # FOR NO KEY UPDATE still lets carts insert holds referencing them
+        variants = list(
+            ProductVariant.objects
+            .select_for_update(no_key=True, of=('self',))
+            .select_related('product')
+            .filter(pk__in=quantities, stock_shards=0)
+            .order_by('pk')
+        )
+        # Sharded variants are never locked as a whole; their stock is taken
+        # shard by shard in decrement_stock()
+        variants += (
+            ProductVariant.objects
+            .select_related('product')
+            .prefetch_related('shards')
+            .filter(pk__in=quantities, stock_shards__gt=0)
+        )
+        errors = []
+        for variant in variants:
+            if not variant.is_active:
+                errors.append(f'{variant} is no longer available')
+            elif variant.available_count + held.get(variant.pk, 0) < quantities[variant.pk]:
+                available = variant.available_count + held.get(variant.pk, 0)
+                errors.append(f'Only {available} of {variant} left in stock')
+        if errors:
+            raise serializers.ValidationError({'cart': errors})
+
+        subtotal = sum(variant.final_price * quantities[variant.pk] for variant in variants)
+        coupon, discount = None, 0
+        if coupon_code:
+            coupon = coupons.get(coupon_code)
+            discount = coupon.discount(subtotal) if coupon else 0
+            if not discount:
+                raise serializers.ValidationError(
+                    {'coupon_code': 'Coupon is not valid or minimum order amount not met'}
+                )
+
+        if not decrement_stock(quantities, held):
+            raise serializers.ValidationError({'cart': 'Stock changed during checkout, please try again'})
+
+        order = Order.objects.create(
+            user=user,
+            order_number=generate_order_number(),
+            total_amount=subtotal - discount,
+            coupon_id=coupon.id if coupon else None,
+            discount_amount=discount,
+            **order_fields
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(
+                order=order,
+                variant=variant,
+                quantity=quantities[variant.pk],
+                price=variant.final_price,
+            )
+            for variant in variants
+        )
+        CartItem.objects.filter(cart__user=user, variant_id__in=quantities).delete()
+        InventoryHold.objects.filter(cart__user=user, variant_id__in=held).delete()
+
+        # Once committed, as catalog.inventory does: the receivers write product
+        # rows (which would stay locked, queueing checkouts of a hot variant,
+        # until the commit) and bump cache versions (under which readers would
+        # otherwise cache the pre-commit stock)
+        product_ids = {variant.product_id for variant in variants}
+        transaction.on_commit(lambda: stock_changed.send(sender=ProductVariant, product_ids=product_ids))
+        transaction.on_commit(lambda: cart_changed.send(sender=Cart, user_id=user.pk))
+        if getattr(settings, 'CATALOG_ROLLUP_AT_CHECKOUT', True):
+            # In its own transaction after the commit, so checkouts never
+            # queue on today's rollup row; rollup_sales catches up failures
+            transaction.on_commit(lambda: rollups.roll_up_order(order.pk), robust=True)
+
+        # Last, so a popular coupon's row stays locked only until the commit
+        if coupon and not redeem(coupon):
+            raise serializers.ValidationError({'coupon_code': 'Coupon has reached its usage limit'})
+    return order
+
+
+def quote(user=None, lines=None, coupon_code=None):
+    """
+    Price a checkout without writing anything: the user's cart, or `lines`
+    ({variant id: quantity}) of an anonymous one.
+
+    Line prices, stock and the buyer's own holds come from one query over
+    the cart's variants and coupons from the in-process coupon book, so the
+    cost does not grow with the cart. Availability is what place_order()
+    would accept right now: unreserved stock plus what this cart holds.
+    """
+    shard_stock = (
+        InventoryShard.objects.filter(variant=OuterRef('pk'))
+        .values('variant').annotate(total=Sum('count')).values('total')
+    )
+    variants = (
+        ProductVariant.objects.select_related('product')
+        .annotate(shard_stock=Coalesce(Subquery(shard_stock), 0))
+        .order_by('product__name', 'name')
+    )
+    if user is not None:
+        held = InventoryHold.objects.filter(cart__user=user, variant=OuterRef('pk')).values('quantity')
+        variants = variants.filter(cartitem__cart__user=user).annotate(
+            line_quantity=F('cartitem__quantity'),
+            held=Coalesce(Subquery(held), 0),
+        )
+    else:
+        lines = lines or {}
+        variants = variants.filter(pk__in=lines).annotate(held=Value(0, output_field=IntegerField()))
+
+    quoted = []
+    for variant in variants:
+        quantity = variant.line_quantity if user is not None else lines[variant.pk]
+        on_hand = variant.shard_stock if variant.is_sharded else max(variant.inventory_count - variant.reserved_count, 0)
+        available = on_hand + variant.held if variant.is_active else 0
+        quoted.append({
+            'variant': variant.pk,
+            'variant_name': variant.name,
+            'variant_sku': variant.sku,
+            'product_name': variant.product.name,
+            'unit_price': variant.final_price,
+            'quantity': quantity,
+            'line_total': variant.final_price * quantity,
+            'available': available,
+            'in_stock': available >= quantity,
+        })
+    subtotal = sum((line['line_total'] for line in quoted), Decimal('0'))
+
+    coupon, discount, coupon_error = None, Decimal('0'), None
+    if coupon_code:
+        coupon = coupons.get(coupon_code)
+        discount = coupon.discount(subtotal) if coupon else Decimal('0')
+        if not discount:
+            coupon, coupon_error = None, 'Coupon is not valid or minimum order amount not met'
+    best, best_discount = coupons.best(subtotal)
+
+    return {
+        'lines': quoted,
+        'total_items': sum(line['quantity'] for line in quoted),
+        'subtotal': subtotal,
+        'coupon': coupon.code if coupon else None,
+        'coupon_error': coupon_error,
+        'discount_amount': discount,
+        'total': subtotal - discount,
+        'best_coupon': {'code': best.code, 'discount_amount': best_discount} if best else None,
+        'can_checkout': bool(quoted) and all(line['in_stock'] for line in quoted),
+    }
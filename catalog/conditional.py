@@ -0,0 +1,89 @@
+import functools
+import hashlib
+from datetime import datetime, timezone
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_versions, normalized_params
+
+# Conditional GET support. Cached endpoints derive their validators from the
+# same version keys (catalog.cache) their cached bodies are keyed on, so a
+# validator never describes a different body than the one served, and a
+# matching If-None-Match / If-Modified-Since costs one cache read: no query
+# and no serialization. Versions live in the shared cache, so every worker
+# agrees on them.
+
+
+def _representation(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer.format if renderer else ''
+
+
+def make_etag(request, *parts):
+    raw = repr((request.path, normalized_params(request), _representation(request)) + parts)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def version_validators(request, version_names):
+    """
+    ETag and Last-Modified for a response cached under `version_names`.
+    Versions are microsecond timestamps of the last change, so the latest
+    is when the response last changed.
+    """
+    versions = get_versions(version_names)
+    last_modified = datetime.fromtimestamp(max(versions.values()) / 1_000_000, tz=timezone.utc)
+    return make_etag(request, *sorted(versions.items())), last_modified
+
+
+def conditional_response(request, etag, last_modified, render):
+    if request.method not in ('GET', 'HEAD') or (etag is None and last_modified is None):
+        return render()
+
+    quoted = quote_etag(etag) if etag else None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=quoted, last_modified=timestamp)
+    if response is not None:
+        return response
+
+    response = render()
+    if response.status_code == 200:
+        if quoted and not response.has_header('ETag'):
+            response['ETag'] = quoted
+        if timestamp is not None and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+def conditional(validators):
+    """
+    Decorator for function views. `validators(request, **kwargs)` returns
+    (etag, last_modified); either may be None.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            etag, last_modified = validators(request, **kwargs)
+            return conditional_response(
+                request, etag, last_modified, lambda: view(request, *args, **kwargs)
+            )
+        return wrapped
+    return decorator
+
+
+class ConditionalGetMixin:
+    """
+    Answer If-None-Match / If-Modified-Since on GET. By default the
+    validators come from get_cache_versions() (CachedResponseMixin);
+    override get_validators() otherwise.
+    """
+
+    def get_validators(self):
+        return version_validators(self.request, self.get_cache_versions())
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        return conditional_response(
+            request, etag, last_modified,
+            lambda: super(ConditionalGetMixin, self).get(request, *args, **kwargs),
+        )
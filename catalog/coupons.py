@@ -0,0 +1,115 @@
+import threading
+import time
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cache import COUPONS_VERSION, bump_versions, get_versions
+from .models import Coupon
+
+CENT = Decimal('0.01')
+
+
+class CompiledCoupon(NamedTuple):
+    """The fields of a Coupon needed to price an order, with no database access"""
+    id: int
+    code: str
+    discount_type: str
+    discount_value: Decimal
+    min_order_amount: Decimal
+    valid_from: object
+    valid_until: object
+
+    def discount(self, amount, now=None):
+        """Discount on an order of `amount`; 0 if the coupon does not apply"""
+        now = now or timezone.now()
+        if not (self.valid_from <= now <= self.valid_until) or amount < self.min_order_amount:
+            return Decimal('0')
+        if self.discount_type == 'percentage':
+            return (amount * self.discount_value / 100).quantize(CENT)
+        return min(self.discount_value, amount)
+
+
+class CouponBook:
+    """
+    The active coupons, compiled and keyed by code, held in process.
+
+    Looking up a code or choosing the best coupon for an order touches no
+    database. Coupon saves bump COUPONS_VERSION (catalog.signals); each
+    process reloads its copy the next time it is used after the version
+    changes, and at least every `refresh_seconds` as validity windows open
+    without a write. Usage counts are not cached: redeem() enforces
+    max_uses in the database.
+    """
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self.coupons = {}
+        self.version = None  # None until first loaded
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        version = get_versions([COUPONS_VERSION])[COUPONS_VERSION]
+        now = timezone.now()
+        rows = (
+            Coupon.objects.filter(is_active=True, valid_until__gte=now)
+            .filter(Q(max_uses__isnull=True) | Q(used_count__lt=F('max_uses')))
+            .values_list(*CompiledCoupon._fields)
+        )
+        self.coupons = {row[1]: CompiledCoupon(*row) for row in rows}
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def is_fresh(self):
+        return (
+            self.version is not None
+            and time.monotonic() - self.loaded_at < self.refresh_seconds
+            and get_versions([COUPONS_VERSION])[COUPONS_VERSION] == self.version
+        )
+
+    def ensure_fresh(self):
+        if self.is_fresh():
+            return
+        with self.lock:
+            if not self.is_fresh():
+                self.load()
+
+    def get(self, code):
+        """The compiled coupon for `code`, or None if there is no usable one"""
+        self.ensure_fresh()
+        return self.coupons.get(code.strip())
+
+    def best(self, amount, now=None):
+        """(coupon, discount) giving the largest discount on `amount`, or (None, 0)"""
+        self.ensure_fresh()
+        now = now or timezone.now()
+        best, best_discount = None, Decimal('0')
+        for coupon in self.coupons.values():
+            discount = coupon.discount(amount, now)
+            if discount > best_discount:
+                best, best_discount = coupon, discount
+        return best, best_discount
+
+
+coupons = CouponBook(refresh_seconds=getattr(settings, 'CATALOG_COUPON_REFRESH', 60))
+
+
+def redeem(coupon):
+    """
+    Count one use of `coupon`, in a single conditional UPDATE that only
+    succeeds while it is active, in its window and under max_uses, so
+    concurrent checkouts can never oversell it. Returns False if it failed.
+    """
+    now = timezone.now()
+    redeemed = Coupon.objects.filter(
+        Q(max_uses__isnull=True) | Q(used_count__lt=F('max_uses')),
+        pk=coupon.id, is_active=True, valid_from__lte=now, valid_until__gte=now,
+    ).update(used_count=F('used_count') + 1)
+    if not redeemed:
+        # Most likely just ran out; stop offering it everywhere
+        bump_versions(COUPONS_VERSION)
+    return bool(redeemed)
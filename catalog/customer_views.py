@@ -4,8 +4,10 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from .models import Product, ProductVariant, Cart, CartItem, Category
-from django.db.models import Q
+from .models import PRODUCT_SORTS, Product, ProductVariant, Cart, CartItem, Category
+from rest_framework.exceptions import ValidationError
+from . import carts
+from .search import search_products_queryset
 
 @login_required
 def customer_catalog(request):
@@ -15,27 +17,25 @@ def customer_catalog(request):
     
     # Search functionality
     search_query = request.GET.get('search', '')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | Q(description__icontains=search_query)
-        )
     
     # Category filter
     category_id = request.GET.get('category', '')
     if category_id:
-        products = products.filter(category_id=category_id)
+        products = products.in_category(category_id)
     
     # Price filter
     min_price = request.GET.get('min_price', '')
     max_price = request.GET.get('max_price', '')
-    if min_price:
-        products = products.filter(base_price__gte=min_price)
-    if max_price:
-        products = products.filter(base_price__lte=max_price)
+    products = products.priced_between(min_price, max_price)
+    
+    # Search after the filters, as the backend may cap its matches
+    products = search_products_queryset(products, search_query, include_category=False)
     
     # Sorting
     sort_by = request.GET.get('sort', '-created_at')
-    products = products.order_by(sort_by)
+    if sort_by not in PRODUCT_SORTS:
+        sort_by = '-created_at'
+    products = products.sorted_by(sort_by)
     
     context = {
         'products': products,
@@ -54,7 +54,7 @@ def customer_catalog(request):
 def product_detail_customer(request, product_id):
     """Customer product detail view"""
     product = get_object_or_404(Product, id=product_id, is_active=True)
-    variants = product.variants.filter(is_active=True)
+    variants = product.variants.filter(is_active=True).prefetch_related('shards')
     
     context = {
         'product': product,
@@ -67,8 +67,8 @@ def product_detail_customer(request, product_id):
 @login_required
 def customer_cart(request):
     """Customer shopping cart view"""
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.select_related('variant__product').all()
+    cart = carts.cart_with_totals(request.user, related=['variant__product__primary_image'])
+    cart_items = cart.items.all() if cart.pk else []
     
     context = {
         'cart': cart,
@@ -86,47 +86,38 @@ def add_to_cart(request):
     quantity = int(request.POST.get('quantity', 1))
     
     try:
-        variant = ProductVariant.objects.get(id=variant_id, is_active=True)
-        
-        if variant.inventory_count < quantity:
-            messages.error(request, f'Only {variant.inventory_count} items available in stock.')
-            return redirect('customer:product_detail', product_id=variant.product.id)
-        
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            variant=variant,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-        
-        messages.success(request, f'{variant.product.name} added to cart!')
-        return redirect('customer:product_detail', product_id=variant.product.id)
-        
+        variant = ProductVariant.objects.select_related('product').get(id=variant_id, is_active=True)
     except ProductVariant.DoesNotExist:
         messages.error(request, 'Product variant not found.')
         return redirect('customer:catalog')
 
+    if quantity < 1:
+        messages.error(request, 'Quantity must be at least 1.')
+        return redirect('customer:product_detail', product_id=variant.product.id)
+
+    cart, created = Cart.objects.get_or_create(user=request.user)
+    try:
+        carts.add_item(cart, variant.pk, quantity)
+    except ValidationError:
+        messages.error(request, f'Only {variant.available_count} items available in stock.')
+    else:
+        messages.success(request, f'{variant.product.name} added to cart!')
+    return redirect('customer:product_detail', product_id=variant.product.id)
+
 @login_required
 @require_POST
 def update_cart_item(request, item_id):
     """Update cart item quantity"""
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+    cart_item = get_object_or_404(CartItem.objects.select_related('cart', 'variant'), id=item_id, cart__user=request.user)
     quantity = int(request.POST.get('quantity', 1))
     
-    if quantity <= 0:
-        cart_item.delete()
-        messages.success(request, 'Item removed from cart.')
+    try:
+        carts.set_item(cart_item.cart, cart_item.variant_id, quantity)
+    except ValidationError:
+        available = cart_item.variant.available_count + cart_item.quantity
+        messages.error(request, f'Only {available} items available in stock.')
     else:
-        if quantity > cart_item.variant.inventory_count:
-            messages.error(request, f'Only {cart_item.variant.inventory_count} items available in stock.')
-        else:
-            cart_item.quantity = quantity
-            cart_item.save()
-            messages.success(request, 'Cart updated.')
+        messages.success(request, 'Cart updated.' if quantity > 0 else 'Item removed from cart.')
     
     return redirect('customer:cart')
 
@@ -134,9 +125,11 @@ def update_cart_item(request, item_id):
 @require_POST
 def remove_cart_item(request, item_id):
     """Remove item from cart"""
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+    cart_item = get_object_or_404(
+        CartItem.objects.select_related('cart', 'variant__product'), id=item_id, cart__user=request.user
+    )
     product_name = cart_item.variant.product.name
-    cart_item.delete()
+    carts.set_item(cart_item.cart, cart_item.variant_id, 0)
     messages.success(request, f'{product_name} removed from cart.')
     
     return redirect('customer:cart')
@@ -145,7 +138,9 @@ def remove_cart_item(request, item_id):
 def category_products(request, category_id):
     """Products by category"""
     category = get_object_or_404(Category, id=category_id, is_active=True)
-    products = Product.objects.filter(category=category, is_active=True).select_related('category').prefetch_related('images', 'variants')
+    products = Product.objects.filter(
+        category__path__startswith=category.path, is_active=True
+    ).select_related('category').prefetch_related('images', 'variants')
     
     context = {
         'category': category,
@@ -0,0 +1,71 @@
+from django.db import connections, router
+
+
+def bulk_increment_or_create(model, rows, unique_fields, increment_fields, replace_fields=()):
+    """
+    Insert `rows` (dicts of field name to value, all with the same keys), or
+    where a row with the same `unique_fields` exists add `increment_fields`
+    to it and overwrite `replace_fields`, in one INSERT ... ON CONFLICT DO
+    UPDATE statement. Returns the resulting rows as model instances.
+
+    bulk_create(update_conflicts=True) can only overwrite columns with the
+    new values; this is for counters that concurrent writers add to, where a
+    get_or_create followed by save() would lose updates.
+    """
+    if not rows:
+        return []
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    meta = model._meta
+    table = quote(meta.db_table)
+
+    # Foreign keys are given by attname (cart_id=...), as raw values
+    names = list(rows[0])
+    fields = [meta.get_field(name) for name in names]
+    columns = [quote(field.column) for field in fields]
+    params = [
+        field.get_db_prep_save(row[name], connection)
+        for row in rows
+        for name, field in zip(names, fields)
+    ]
+    placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+    conflict = [quote(meta.get_field(name).column) for name in unique_fields]
+    assignments = [
+        f'{column} = {table}.{column} + EXCLUDED.{column}'
+        for column in (quote(meta.get_field(name).column) for name in increment_fields)
+    ] + [
+        f'{column} = EXCLUDED.{column}'
+        for column in (quote(meta.get_field(name).column) for name in replace_fields)
+    ]
+    returned = meta.concrete_fields
+
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([placeholders] * len(rows))} '
+        f'ON CONFLICT ({", ".join(conflict)}) DO UPDATE SET {", ".join(assignments)} '
+        f'RETURNING {", ".join(f"{table}.{quote(field.column)}" for field in returned)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        results = cursor.fetchall()
+
+    # Same conversions the ORM applies to fetched values (e.g. datetimes on SQLite)
+    converters = []
+    for field in returned:
+        column = field.get_col(meta.db_table)
+        converters.append((
+            column, connection.ops.get_db_converters(column) + column.get_db_converters(connection)
+        ))
+    instances = []
+    for result in results:
+        values = []
+        for (column, column_converters), value in zip(converters, result):
+            for converter in column_converters:
+                value = converter(value, column, connection)
+            values.append(value)
+        instances.append(model.from_db(connection.alias, [field.attname for field in returned], values))
+    return instances
+
+
+def increment_or_create(model, values, unique_fields, increment_fields, replace_fields=()):
+    """Single-row bulk_increment_or_create(); returns the resulting instance"""
+    return bulk_increment_or_create(model, [values], unique_fields, increment_fields, replace_fields)[0]
@@ -0,0 +1,76 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Floor
+
+RATING_THRESHOLDS = [4, 3, 2, 1]
+
+
+def get_price_bucket_size(value=None):
+    default = Decimal(str(getattr(settings, 'CATALOG_FACET_PRICE_BUCKET', 100)))
+    try:
+        size = Decimal(value) if value else default
+    except InvalidOperation:
+        return default
+    return size if size > 0 else default
+
+
+def _facet_rows(queryset, price_bucket_size):
+    # The column ProductQuerySet.priced_between filters
+    price_bucket = Floor(ExpressionWrapper(
+        F('min_price') / Value(price_bucket_size),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    ))
+    return (
+        queryset.order_by()
+        .values('category_id', 'category__name', 'in_stock',
+                price_bucket=price_bucket, rating_bucket=Floor('average_rating'))
+        .annotate(count=Count('pk'))
+    )
+
+
+def compute_facets(querysets, price_bucket_size):
+    """
+    Category, price histogram, minimum rating and stock facets for disjoint
+    product querysets (see catalog.search.search_partitions), computed in a
+    GROUP BY over the combination of facet keys per queryset and folded into
+    the individual facets in Python.
+    """
+    rows = (row for queryset in querysets for row in _facet_rows(queryset, price_bucket_size))
+
+    categories = {}
+    prices = {}
+    ratings = {}
+    stock = {'in_stock': 0, 'out_of_stock': 0}
+    for row in rows:
+        count = row['count']
+        category = categories.setdefault(row['category_id'], {
+            'id': row['category_id'], 'name': row['category__name'], 'count': 0
+        })
+        category['count'] += count
+        bucket = int(row['price_bucket'])
+        prices[bucket] = prices.get(bucket, 0) + count
+        rating = int(row['rating_bucket'])
+        ratings[rating] = ratings.get(rating, 0) + count
+        stock['in_stock' if row['in_stock'] else 'out_of_stock'] += count
+
+    return {
+        'categories': sorted(categories.values(), key=lambda c: (-c['count'], c['name'])),
+        'price': [
+            {
+                'min': bucket * price_bucket_size,
+                'max': (bucket + 1) * price_bucket_size,
+                'count': prices[bucket],
+            }
+            for bucket in sorted(prices)
+        ],
+        'rating': [
+            {
+                'min_rating': threshold,
+                'count': sum(count for rating, count in ratings.items() if rating >= threshold),
+            }
+            for threshold in RATING_THRESHOLDS
+        ],
+        'stock': stock,
+    }
@@ -0,0 +1,254 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Sum
+
+from . import inventory, suggest
+from .cache import PRODUCTS_VERSION, bump_versions, category_version, product_version
+from .models import Category, InventoryHold, Product, ProductVariant
+from .search import search_backend
+
+# Catalog feed import.
+#
+# A feed is CSV or JSON Lines with one row per variant (or per product, for
+# a product without variants), the product's fields repeated on each of its
+# rows:
+#
+#   sku, name, description, category, base_price, is_active,
+#   variant_sku, variant_name, price_modifier, inventory_count, variant_is_active
+#
+# Products and variants are matched by SKU and categories by name;
+# `category` may be a path such as "Electronics > Phones", whose missing
+# categories are created under the ones before them. Rows are read and
+# written `batch_size` at a time, so memory does not grow with the feed:
+# each batch is one transaction of a few set-based statements, with
+# bulk_create(update_conflicts=True) inserting or updating every product and
+# variant. Those bypass save() and signals, so the batch then refreshes the
+# summaries, search index and cache versions of the products it touched.
+
+CATEGORY_SEPARATOR = '>'
+PRODUCT_UPDATE_FIELDS = ['name', 'description', 'category', 'base_price', 'is_active', 'updated_at']
+VARIANT_UPDATE_FIELDS = ['product', 'name', 'price_modifier', 'inventory_count', 'is_active']
+TRUE, FALSE = {'1', 'true', 'yes', 'y', 't'}, {'0', 'false', 'no', 'n', 'f'}
+
+
+def read_rows(stream, format):
+    """Yield (line number, row dict) from a 'csv' or 'jsonl' text stream"""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                row = error
+            yield number, row
+
+
+def _text(row, key, required=True):
+    value = row.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'{key} is required')
+    return value
+
+
+def _decimal(row, key, default=None):
+    value = _text(row, key, required=default is None) or default
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'{key} is not a number: {value!r}')
+
+
+def _bool(row, key):
+    value = row.get(key)
+    if isinstance(value, bool):
+        return value
+    value = '' if value is None else str(value).strip().lower()
+    if not value:
+        return True
+    if value not in TRUE | FALSE:
+        raise ValueError(f'{key} is not a boolean: {value!r}')
+    return value in TRUE
+
+
+def parse_row(row):
+    """(product fields, variant fields or None) of a feed row; raises ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError(f'not a JSON object: {row}')
+    base_price = _decimal(row, 'base_price')
+    if base_price < 0:
+        raise ValueError('base_price is negative')
+    category = tuple(
+        name.strip() for name in _text(row, 'category').split(CATEGORY_SEPARATOR) if name.strip()
+    )
+    product = {
+        'sku': _text(row, 'sku'),
+        'name': _text(row, 'name'),
+        'description': _text(row, 'description', required=False),
+        'category': category,
+        'base_price': base_price,
+        'is_active': _bool(row, 'is_active'),
+    }
+    if not _text(row, 'variant_sku', required=False):
+        return product, None
+    try:
+        inventory_count = int(_text(row, 'inventory_count', required=False) or 0)
+    except ValueError:
+        raise ValueError(f'inventory_count is not an integer: {row.get("inventory_count")!r}')
+    if inventory_count < 0:
+        raise ValueError('inventory_count is negative')
+    variant = {
+        'sku': _text(row, 'variant_sku'),
+        'name': _text(row, 'variant_name'),
+        'price_modifier': _decimal(row, 'price_modifier', default='0'),
+        'inventory_count': inventory_count,
+        'is_active': _bool(row, 'variant_is_active'),
+    }
+    return product, variant
+
+
+class CatalogImport:
+    """
+    Imports feed rows in batches; run() yields the counts of each batch.
+    With `dry_run` everything is read and validated, and what would be
+    created or updated is counted, without writing anything.
+    """
+
+    def __init__(self, batch_size=1000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        # Category path -> id, or None for one a dry run would create
+        self.categories = {}
+
+    def run(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield self.import_batch(batch)
+                batch = []
+        if batch:
+            yield self.import_batch(batch)
+        if not self.dry_run:
+            suggest.invalidate()
+
+    def resolve_categories(self, paths, counts):
+        """Fill self.categories for `paths`, creating missing categories"""
+        missing = {path[:depth] for path in paths for depth in range(1, len(path) + 1)} - self.categories.keys()
+        if not missing:
+            return
+        existing = dict(
+            Category.objects.filter(name__in={path[-1] for path in missing}).values_list('name', 'pk')
+        )
+        # Parents before children
+        for path in sorted(missing, key=len):
+            name = path[-1]
+            if name not in existing:
+                counts['categories_created'] += 1
+                existing[name] = None if self.dry_run else Category.objects.create(
+                    name=name, parent_id=self.categories[path[:-1]] if len(path) > 1 else None
+                ).pk
+            self.categories[path] = existing[name]
+
+    def import_batch(self, rows):
+        counts = dict.fromkeys([
+            'rows', 'products_created', 'products_updated', 'variants_created', 'variants_updated',
+            'categories_created',
+        ], 0)
+        counts['errors'] = []
+        products, variants = {}, {}
+        for line, row in rows:
+            counts['rows'] += 1
+            try:
+                product, variant = parse_row(row)
+            except ValueError as error:
+                counts['errors'].append((line, str(error)))
+                continue
+            # Later rows win, as one upsert cannot change a row twice
+            products[product['sku']] = product
+            if variant is not None:
+                variants[variant['sku']] = dict(variant, product=product['sku'])
+
+        with transaction.atomic():
+            self.resolve_categories({product['category'] for product in products.values()}, counts)
+            existing_products = {
+                sku: (pk, category_id) for sku, pk, category_id in
+                Product.objects.filter(sku__in=products).values_list('sku', 'pk', 'category_id')
+            }
+            existing_variants = {
+                sku: (product_id, shards) for sku, product_id, shards in
+                ProductVariant.objects.filter(sku__in=variants).values_list('sku', 'product_id', 'stock_shards')
+            }
+            counts['products_updated'] = len(existing_products)
+            counts['products_created'] = len(products) - len(existing_products)
+            counts['variants_updated'] = len(existing_variants)
+            counts['variants_created'] = len(variants) - len(existing_variants)
+            if self.dry_run or not products:
+                return counts
+
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        sku=sku, name=product['name'], description=product['description'],
+                        category_id=self.categories[product['category']], base_price=product['base_price'],
+                        is_active=product['is_active'],
+                    )
+                    for sku, product in products.items()
+                ],
+                update_conflicts=True, unique_fields=['sku'], update_fields=PRODUCT_UPDATE_FIELDS,
+            )
+            product_ids = dict(Product.objects.filter(sku__in=products).values_list('sku', 'pk'))
+
+            # Sharded variants keep their stock in shards, set below
+            sharded = {sku for sku, (_, shards) in existing_variants.items() if shards}
+            for skus, update_fields in [
+                (variants.keys() - sharded, VARIANT_UPDATE_FIELDS),
+                (sharded, [field for field in VARIANT_UPDATE_FIELDS if field != 'inventory_count']),
+            ]:
+                if skus:
+                    ProductVariant.objects.bulk_create(
+                        [
+                            ProductVariant(
+                                sku=sku, product_id=product_ids[variants[sku]['product']],
+                                name=variants[sku]['name'], price_modifier=variants[sku]['price_modifier'],
+                                inventory_count=variants[sku]['inventory_count'],
+                                is_active=variants[sku]['is_active'],
+                            )
+                            for sku in skus
+                        ],
+                        update_conflicts=True, unique_fields=['sku'], update_fields=update_fields,
+                    )
+            if sharded:
+                # The feed counts units on hand, including those carts hold
+                held = dict(
+                    InventoryHold.objects.filter(variant__sku__in=sharded).order_by()
+                    .values('variant__sku').annotate(total=Sum('quantity'))
+                    .values_list('variant__sku', 'total')
+                )
+                for variant in ProductVariant.objects.filter(sku__in=sharded):
+                    on_hand = variants[variant.sku]['inventory_count'] - held.get(variant.sku, 0)
+                    inventory.set_stock(variant, max(on_hand, 0))
+
+            # Including products a variant moved away from
+            touched = set(product_ids.values()) | {product_id for product_id, _ in existing_variants.values()}
+            touched_products = Product.objects.filter(pk__in=touched)
+            touched_products.refresh_summaries()
+            search_backend.update_products(touched_products)
+
+            # And the listings of categories a product moved away from
+            category_ids = set(touched_products.values_list('category_id', flat=True))
+            category_ids |= {category_id for _, category_id in existing_products.values()}
+            paths = Category.objects.filter(pk__in=category_ids).values_list('path', flat=True)
+            bump_versions(
+                PRODUCTS_VERSION,
+                *[product_version(product_id) for product_id in touched],
+                *{category_version(pk) for path in paths for pk in Category.ids_from_path(path)},
+            )
+        return counts
@@ -0,0 +1,422 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from .db import bulk_increment_or_create, increment_or_create
+from .models import Cart, InventoryHold, InventoryShard, ProductVariant
+
+# Stock held by carts.
+#
+# Every hold is mirrored in ProductVariant.reserved_count, so available stock
+# (inventory_count - reserved_count) is read from the variant row alone and
+# taking more is a single conditional UPDATE on that row; nothing ever locks a
+# hot variant for longer than that statement. Holds are set or released
+# under a lock on the (per-user, uncontended) cart row, which keeps each
+# cart's holds and the counters in step; hold_more() only adds to a hold, as
+# an upsert that concurrent adders cannot lose, and takes no cart lock.
+# Writers touch cart lines, holds and variant rows in that order, so they
+# queue rather than deadlock. Expired holds still count until
+# release_expired() returns them, in batches.
+#
+# A variant hot enough that even single-statement updates of its row queue
+# up can be sharded: its stock moves into `stock_shards` InventoryShard rows
+# and each sale or hold takes from a randomly chosen shard, so concurrent
+# buyers mostly update different rows. Holds on a sharded variant take their
+# units straight out of the shards (and give them back on release) instead
+# of counting them in reserved_count, so its variant row is never written.
+
+
+def hold_ttl():
+    return timedelta(seconds=getattr(settings, 'CATALOG_HOLD_TTL', 15 * 60))
+
+
+def _adjust_reserved(deltas):
+    """Apply {variant id: change in reserved units} in one UPDATE"""
+    deltas = {variant_id: delta for variant_id, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return ProductVariant.objects.filter(pk__in=deltas).update(
+        reserved_count=Case(
+            *[When(pk=variant_id, then=F('reserved_count') + delta) for variant_id, delta in deltas.items()],
+            default=F('reserved_count'),
+            output_field=PositiveIntegerField(),
+        )
+    )
+
+
+def _stock_changed(variant_ids):
+    """
+    Once committed, send catalog.signals.stock_changed for the products of
+    `variant_ids`: their available counts are part of product payloads.
+    """
+    # catalog.signals imports this module
+    from .signals import stock_changed
+
+    variant_ids = list(variant_ids)
+    if not variant_ids:
+        return
+
+    def send():
+        product_ids = set(
+            ProductVariant.objects.filter(pk__in=variant_ids).values_list('product_id', flat=True)
+        )
+        stock_changed.send(sender=InventoryHold, product_ids=product_ids)
+    transaction.on_commit(send)
+
+
+def lock_cart(cart):
+    Cart.objects.select_for_update().filter(pk=cart.pk).exists()
+
+
+def _shard_counts(variant_ids):
+    """{variant id: number of shards} for the sharded variants among `variant_ids`"""
+    return dict(
+        ProductVariant.objects.filter(pk__in=variant_ids, stock_shards__gt=0)
+        .values_list('pk', 'stock_shards')
+    )
+
+
+def _return_units(deltas):
+    """Give back {variant id: units} held or sold, to shards or reserved_count as appropriate"""
+    deltas = {variant_id: units for variant_id, units in deltas.items() if units}
+    sharded = _shard_counts(deltas)
+    for variant_id, shards in sharded.items():
+        return_to_shards(variant_id, shards, deltas.pop(variant_id))
+    _adjust_reserved({variant_id: -units for variant_id, units in deltas.items()})
+
+
+class _Shortage(Exception):
+    def __init__(self, variant_ids):
+        self.variant_ids = variant_ids
+
+
+def reserve_many(cart, quantities):
+    """
+    Set a cart's holds to `quantities` ({variant id: quantity}, 0 drops the
+    hold) and restart their expiry, in a fixed number of statements for
+    unsharded variants.
+
+    Returns the ids of the variants that are inactive or short of stock, in
+    which case nothing is changed; an empty list means every hold was taken.
+    """
+    try:
+        with transaction.atomic():
+            lock_cart(cart)
+            held = dict(
+                InventoryHold.objects.select_for_update()
+                .filter(cart=cart, variant_id__in=quantities)
+                .values_list('variant_id', 'quantity')
+            )
+            variants = {
+                pk: (is_active, inventory_count - reserved_count, shards)
+                for pk, is_active, inventory_count, reserved_count, shards in
+                ProductVariant.objects.filter(pk__in=quantities)
+                .values_list('pk', 'is_active', 'inventory_count', 'reserved_count', 'stock_shards')
+            }
+            extra = {
+                variant_id: quantity - held.get(variant_id, 0)
+                for variant_id, quantity in quantities.items()
+                if variant_id in variants and quantity != held.get(variant_id, 0)
+            }
+
+            # Checked up front for a precise answer; the UPDATE below is what
+            # actually guards against concurrent holds
+            short = []
+            for variant_id, quantity in quantities.items():
+                if quantity and variant_id not in variants:
+                    short.append(variant_id)
+                elif extra.get(variant_id, 0) > 0:
+                    is_active, available, shards = variants[variant_id]
+                    if not is_active or (not shards and available < extra[variant_id]):
+                        short.append(variant_id)
+            if short:
+                raise _Shortage(short)
+
+            now = timezone.now()
+            expires_at = now + hold_ttl()
+            dropped = [variant_id for variant_id, quantity in quantities.items() if not quantity]
+            if dropped:
+                InventoryHold.objects.filter(cart=cart, variant_id__in=dropped).delete()
+            kept = {
+                variant_id: quantity for variant_id, quantity in quantities.items()
+                if quantity and variant_id in held
+            }
+            if kept:
+                InventoryHold.objects.filter(cart=cart, variant_id__in=kept).update(
+                    quantity=Case(
+                        *[When(variant_id=variant_id, then=Value(quantity)) for variant_id, quantity in kept.items()],
+                        output_field=PositiveIntegerField(),
+                    ),
+                    expires_at=expires_at,
+                )
+            # New holds are added to, not overwritten, should hold_more()
+            # insert the same one meanwhile
+            bulk_increment_or_create(
+                InventoryHold,
+                [
+                    {'cart_id': cart.pk, 'variant_id': variant_id, 'quantity': quantity,
+                     'expires_at': expires_at, 'created_at': now}
+                    for variant_id, quantity in quantities.items() if quantity and variant_id not in held
+                ],
+                unique_fields=['cart', 'variant'],
+                increment_fields=['quantity'],
+                replace_fields=['expires_at'],
+            )
+
+            unsharded = {}
+            for variant_id, units in extra.items():
+                shards = variants[variant_id][2]
+                if not shards:
+                    unsharded[variant_id] = units
+                elif units > 0 and not take_from_shards(variant_id, shards, units):
+                    raise _Shortage([variant_id])
+                elif units < 0:
+                    return_to_shards(variant_id, shards, -units)
+
+            if unsharded:
+                enough = Q()
+                for variant_id, units in unsharded.items():
+                    if units > 0:
+                        enough |= Q(pk=variant_id, inventory_count__gte=F('reserved_count') + units)
+                    else:
+                        enough |= Q(pk=variant_id)
+                updated = ProductVariant.objects.filter(enough).update(
+                    reserved_count=Case(
+                        *[When(pk=variant_id, then=F('reserved_count') + units)
+                          for variant_id, units in unsharded.items()],
+                        default=F('reserved_count'),
+                        output_field=PositiveIntegerField(),
+                    )
+                )
+                if updated != len(unsharded):
+                    raise _Shortage([variant_id for variant_id, units in unsharded.items() if units > 0])
+            _stock_changed(extra)
+    except _Shortage as shortage:
+        return shortage.variant_ids
+    return []
+
+
+def reserve(cart, variant_id, quantity):
+    """
+    Hold `quantity` units of a variant for a cart, replacing any previous
+    hold and restarting its expiry. Returns False, holding nothing new, if
+    that much is not available.
+    """
+    return not reserve_many(cart, {variant_id: quantity})
+
+
+def hold_more(cart, variant_id, quantity):
+    """
+    Add `quantity` units to a cart's hold on a variant and restart its
+    expiry, in two statements: an upsert adding to the hold and a
+    conditional UPDATE taking the units from stock. Returns False if the
+    variant is inactive or short; callers run this in a transaction and roll
+    back.
+    """
+    now = timezone.now()
+    increment_or_create(
+        InventoryHold,
+        {'cart_id': cart.pk, 'variant_id': variant_id, 'quantity': quantity,
+         'expires_at': now + hold_ttl(), 'created_at': now},
+        unique_fields=['cart', 'variant'],
+        increment_fields=['quantity'],
+        replace_fields=['expires_at'],
+    )
+    if not ProductVariant.objects.filter(
+        pk=variant_id, is_active=True, stock_shards=0, inventory_count__gte=F('reserved_count') + quantity
+    ).update(reserved_count=F('reserved_count') + quantity):
+        shards = (
+            ProductVariant.objects.filter(pk=variant_id, is_active=True)
+            .values_list('stock_shards', flat=True).first()
+        )
+        if not shards or not take_from_shards(variant_id, shards, quantity):
+            return False
+    _stock_changed([variant_id])
+    return True
+
+
+def release(cart, variant_ids=None):
+    """Give back a cart's holds, on the given variants or all of them"""
+    with transaction.atomic():
+        lock_cart(cart)
+        holds = InventoryHold.objects.filter(cart=cart)
+        if variant_ids is not None:
+            holds = holds.filter(variant_id__in=variant_ids)
+        released = dict(holds.select_for_update().values_list('variant_id', 'quantity'))
+        if released:
+            holds.delete()
+            _return_units(released)
+            _stock_changed(released)
+    return released
+
+
+def release_expired(batch_size=1000, now=None):
+    """Return expired holds to stock; yields the number released per batch"""
+    now = now or timezone.now()
+    while True:
+        with transaction.atomic():
+            # skip_locked lets several sweepers, and carts renewing a hold,
+            # work at the same time without waiting on each other
+            batch = list(
+                InventoryHold.objects
+                .select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', 'variant_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                return
+            units = defaultdict(int)
+            for _, variant_id, quantity in batch:
+                units[variant_id] += quantity
+            InventoryHold.objects.filter(pk__in=[pk for pk, _, _ in batch]).delete()
+            _return_units(units)
+            _stock_changed(units)
+        yield len(batch)
+
+
+def decrement_stock(quantities, held=None):
+    """
+    Sell `quantities` ({variant id: quantity}), consuming the buyer's `held`
+    units ({variant id: quantity}) first.
+
+    Unsharded variants are updated in one statement, and each row only if it
+    still holds enough unreserved stock. Sharded variants take whatever the
+    holds did not cover from their shards. Returns False if anything was
+    short; callers run this inside a transaction and roll back.
+    """
+    quantities, held = dict(quantities), dict(held or {})
+    sharded = _shard_counts(quantities.keys() | held.keys())
+    for variant_id, shards in sharded.items():
+        needed = quantities.pop(variant_id, 0) - held.pop(variant_id, 0)
+        if needed > 0 and not take_from_shards(variant_id, shards, needed):
+            return False
+        if needed < 0:
+            return_to_shards(variant_id, shards, -needed)
+    if not quantities and not held:
+        return True
+
+    enough = Q()
+    for variant_id, quantity in quantities.items():
+        enough |= Q(pk=variant_id, inventory_count__gte=F('reserved_count') - held.get(variant_id, 0) + quantity)
+    for variant_id in held.keys() - quantities.keys():
+        enough |= Q(pk=variant_id)
+
+    changes = {
+        'inventory_count': Case(
+            *[When(pk=variant_id, then=F('inventory_count') - quantity)
+              for variant_id, quantity in quantities.items()],
+            default=F('inventory_count'),
+            output_field=PositiveIntegerField(),
+        ),
+    }
+    if held:
+        changes['reserved_count'] = Case(
+            *[When(pk=variant_id, then=F('reserved_count') - quantity) for variant_id, quantity in held.items()],
+            default=F('reserved_count'),
+            output_field=PositiveIntegerField(),
+        )
+    updated = ProductVariant.objects.filter(enough).update(**changes)
+    return updated == len(quantities.keys() | held.keys())
+
+
+# Sharded stock
+
+def _split(total, shards):
+    """Spread `total` units as evenly as possible over `shards` counters"""
+    share, extra = divmod(total, shards)
+    return {shard: share + (shard < extra) for shard in range(shards)}
+
+
+def _set_shards(variant_id, counts):
+    InventoryShard.objects.filter(variant_id=variant_id).update(
+        count=Case(
+            *[When(shard=shard, then=Value(count)) for shard, count in counts.items()],
+            default=Value(0),
+            output_field=PositiveIntegerField(),
+        )
+    )
+
+
+def _lock_shards(variant_id):
+    return dict(
+        InventoryShard.objects.select_for_update()
+        .filter(variant_id=variant_id).order_by('shard')
+        .values_list('shard', 'count')
+    )
+
+
+def take_from_shards(variant_id, shards, quantity):
+    """
+    Take `quantity` units of a sharded variant's stock. Tries the shards in
+    random order, one conditional UPDATE each; if no single shard has enough
+    it locks them all, takes across them and evens out what is left.
+    Returns False, taking nothing, if the shards hold less than `quantity`.
+    """
+    for shard in random.sample(range(shards), shards):
+        if InventoryShard.objects.filter(
+            variant_id=variant_id, shard=shard, count__gte=quantity
+        ).update(count=F('count') - quantity):
+            return True
+
+    with transaction.atomic():
+        counts = _lock_shards(variant_id)
+        total = sum(counts.values())
+        if total < quantity:
+            return False
+        _set_shards(variant_id, _split(total - quantity, len(counts)))
+    return True
+
+
+def return_to_shards(variant_id, shards, quantity):
+    InventoryShard.objects.filter(
+        variant_id=variant_id, shard=random.randrange(shards)
+    ).update(count=F('count') + quantity)
+
+
+def rebalance(variant):
+    """Even out a sharded variant's stock across its shards"""
+    with transaction.atomic():
+        counts = _lock_shards(variant.pk)
+        _set_shards(variant.pk, _split(sum(counts.values()), len(counts)))
+
+
+def set_stock(variant, count):
+    """Set a sharded variant's stock on hand (not counting units carts hold)"""
+    with transaction.atomic():
+        counts = _lock_shards(variant.pk)
+        _set_shards(variant.pk, _split(count, len(counts)))
+
+
+def enable_sharding(variant, shards):
+    """Move a variant's stock into `shards` counters; its outstanding holds stay held"""
+    with transaction.atomic():
+        variant = ProductVariant.objects.select_for_update().get(pk=variant.pk)
+        if variant.is_sharded:
+            disable_sharding(variant)
+            variant.refresh_from_db()
+        available = max(variant.inventory_count - variant.reserved_count, 0)
+        InventoryShard.objects.bulk_create(
+            InventoryShard(variant=variant, shard=shard, count=count)
+            for shard, count in _split(available, shards).items()
+        )
+        ProductVariant.objects.filter(pk=variant.pk).update(
+            inventory_count=0, reserved_count=0, stock_shards=shards
+        )
+
+
+def disable_sharding(variant):
+    """Fold a sharded variant's stock back into inventory_count"""
+    with transaction.atomic():
+        ProductVariant.objects.select_for_update().filter(pk=variant.pk).exists()
+        on_hand = sum(_lock_shards(variant.pk).values())
+        held = InventoryHold.objects.filter(variant=variant).aggregate(total=Sum('quantity'))['total'] or 0
+        InventoryShard.objects.filter(variant=variant).delete()
+        ProductVariant.objects.filter(pk=variant.pk).update(
+            inventory_count=on_hand + held, reserved_count=held, stock_shards=0
+        )
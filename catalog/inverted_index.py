@@ -0,0 +1,212 @@
+import os
+import pickle
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+# Field bits stored per posting, and how much a single occurrence of a term
+# in that field contributes to a document's score.
+NAME, DESCRIPTION, CATEGORY = 1, 2, 4
+FIELD_WEIGHTS = {NAME: 10, DESCRIPTION: 4, CATEGORY: 2}
+MAX_SCORE = 0xFFFF
+
+SNAPSHOT_VERSION = 2
+
+
+class Postings:
+    """
+    Posting list for one term: parallel arrays sorted by product id, holding
+    the product ids (uint32), the term's score in each product and a bitmask
+    of the fields it occurs in.
+    """
+    __slots__ = ('ids', 'scores', 'fields')
+
+    def __init__(self):
+        self.ids = array('I')
+        self.scores = array('H')
+        self.fields = array('B')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, doc_id, score, fields):
+        position = bisect_left(self.ids, doc_id)
+        if position < len(self.ids) and self.ids[position] == doc_id:
+            self.scores[position] = score
+            self.fields[position] = fields
+            return
+        self.ids.insert(position, doc_id)
+        self.scores.insert(position, score)
+        self.fields.insert(position, fields)
+
+    def append(self, doc_id, score, fields):
+        # Only valid while building in ascending id order
+        self.ids.append(doc_id)
+        self.scores.append(score)
+        self.fields.append(fields)
+
+    def remove(self, doc_id):
+        position = bisect_left(self.ids, doc_id)
+        if position < len(self.ids) and self.ids[position] == doc_id:
+            del self.ids[position]
+            del self.scores[position]
+            del self.fields[position]
+
+
+class InvertedIndex:
+    """
+    In-memory inverted index over product name, description and category
+    name. Terms are matched as prefixes (like the PostgreSQL backend), all
+    query terms must match, and documents are scored by weighted term
+    frequency.
+
+    Safe to share between threads. Each process keeps its own copy, so a
+    snapshot written with save() is how workers start without rebuilding.
+    """
+
+    def __init__(self, tokenize):
+        self.tokenize = tokenize
+        self.postings = {}
+        self.terms = []  # sorted, for prefix lookups
+        self.documents = {}  # product id -> terms it is listed under
+        # When the rows it was last built or caught up from were read; kept
+        # in snapshots so a loading worker knows which rows to re-read
+        self.synced_at = None
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def analyze(self, name, description, category_name):
+        counts = Counter()
+        fields = defaultdict(int)
+        for field, text in ((NAME, name), (DESCRIPTION, description), (CATEGORY, category_name)):
+            for term in self.tokenize(text or ''):
+                counts[term] += FIELD_WEIGHTS[field]
+                fields[term] |= field
+        return {term: (min(score, MAX_SCORE), fields[term]) for term, score in counts.items()}
+
+    def _postings_for(self, term):
+        postings = self.postings.get(term)
+        if postings is None:
+            postings = self.postings[term] = Postings()
+            insort(self.terms, term)
+        return postings
+
+    def _drop_term(self, term):
+        del self.postings[term]
+        position = bisect_left(self.terms, term)
+        del self.terms[position]
+
+    def add(self, doc_id, name, description, category_name):
+        analyzed = self.analyze(name, description, category_name)
+        with self.lock:
+            self._remove(doc_id)
+            for term, (score, fields) in analyzed.items():
+                self._postings_for(term).add(doc_id, score, fields)
+            self.documents[doc_id] = tuple(analyzed)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        for term in self.documents.pop(doc_id, ()):
+            postings = self.postings[term]
+            postings.remove(doc_id)
+            if not postings:
+                self._drop_term(term)
+
+    def build(self, rows):
+        """Replace the index contents with rows of (id, name, description, category name) in id order"""
+        postings = {}
+        documents = {}
+        for doc_id, name, description, category_name in rows:
+            analyzed = self.analyze(name, description, category_name)
+            for term, (score, fields) in analyzed.items():
+                if term not in postings:
+                    postings[term] = Postings()
+                postings[term].append(doc_id, score, fields)
+            documents[doc_id] = tuple(analyzed)
+        with self.lock:
+            self.postings = postings
+            self.documents = documents
+            self.terms = sorted(postings)
+
+    def expand(self, prefix):
+        position = bisect_left(self.terms, prefix)
+        while position < len(self.terms) and self.terms[position].startswith(prefix):
+            yield self.terms[position]
+            position += 1
+
+    def search(self, query, limit=None, include_category=True):
+        """Return [(product id, score)] best first"""
+        query_terms = self.tokenize(query)
+        if not query_terms:
+            return []
+        allowed_fields = NAME | DESCRIPTION | (CATEGORY if include_category else 0)
+
+        with self.lock:
+            scores = None
+            # Narrowest term first keeps the running intersection small
+            for matches in sorted((self._match(term, allowed_fields) for term in query_terms), key=len):
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {doc_id: score + matches[doc_id] for doc_id, score in scores.items() if doc_id in matches}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def _match(self, prefix, allowed_fields):
+        matches = {}
+        for term in self.expand(prefix):
+            postings = self.postings[term]
+            for doc_id, score, fields in zip(postings.ids, postings.scores, postings.fields):
+                if fields & allowed_fields:
+                    matches[doc_id] = max(matches.get(doc_id, 0), score)
+        return matches
+
+    def save(self, path):
+        with self.lock:
+            state = {
+                'version': SNAPSHOT_VERSION,
+                'postings': {
+                    term: (p.ids.tobytes(), p.scores.tobytes(), p.fields.tobytes())
+                    for term, p in self.postings.items()
+                },
+                'documents': self.documents,
+                'synced_at': self.synced_at,
+            }
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as handle:
+            pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(handle.name, path)
+
+    def load(self, path):
+        """Load a snapshot written by save(); returns False if it is missing or outdated"""
+        try:
+            with open(path, 'rb') as handle:
+                state = pickle.load(handle)
+        except FileNotFoundError:
+            return False
+        if state.get('version') != SNAPSHOT_VERSION:
+            return False
+
+        postings = {}
+        for term, (ids, scores, fields) in state['postings'].items():
+            p = postings[term] = Postings()
+            p.ids.frombytes(ids)
+            p.scores.frombytes(scores)
+            p.fields.frombytes(fields)
+        with self.lock:
+            self.postings = postings
+            self.documents = state['documents']
+            self.terms = sorted(postings)
+            self.synced_at = state['synced_at']
+        return True
@@ -0,0 +1,69 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from catalog.importer import CatalogImport, read_rows
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+class Command(BaseCommand):
+    help = 'Create or update categories, products and variants from a CSV or JSON Lines feed, matched by SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file, or - for standard input')
+        parser.add_argument(
+            '--format', choices=sorted(set(FORMATS.values())),
+            help='Feed format (default: from the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows imported per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Validate the feed and count what would change without writing anything'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or next(
+            (format for extension, format in FORMATS.items() if path.lower().endswith(extension)), None
+        )
+        if format is None:
+            raise CommandError('Cannot tell the feed format from the file name; use --format')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        except OSError as error:
+            raise CommandError(error)
+
+        importer = CatalogImport(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        verb = 'Checked' if options['dry_run'] else 'Imported'
+        totals = {}
+        started = batch_started = time.monotonic()
+        with stream:
+            for counts in importer.run(read_rows(stream, format)):
+                for line, message in counts.pop('errors'):
+                    self.stderr.write(f'Line {line}: {message}')
+                    totals['errors'] = totals.get('errors', 0) + 1
+                for key, count in counts.items():
+                    totals[key] = totals.get(key, 0) + count
+                now = time.monotonic()
+                self.stdout.write(
+                    f'{verb} {totals["rows"]} rows ({counts["rows"] / max(now - batch_started, 1e-6):.0f} rows/s)...'
+                )
+                batch_started = now
+
+        elapsed = time.monotonic() - started
+        summary = (
+            f'{verb} {totals.get("rows", 0)} rows in {elapsed:.1f}s '
+            f'({totals.get("rows", 0) / max(elapsed, 1e-6):.0f} rows/s): '
+            f'{totals.get("products_created", 0)} products created, {totals.get("products_updated", 0)} updated; '
+            f'{totals.get("variants_created", 0)} variants created, {totals.get("variants_updated", 0)} updated; '
+            f'{totals.get("categories_created", 0)} categories created; {totals.get("errors", 0)} rows skipped'
+        )
+        if options['dry_run']:
+            summary += ' (dry run, nothing written)'
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from catalog.models import Product
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized price, stock, rating and primary image summaries on Product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of products updated per statement (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        total = 0
+
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            Product.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).refresh_summaries()
+            last_id = batch[-1]
+            total += len(batch)
+            self.stdout.write(f'Refreshed {total} products...')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt summaries for {total} products'))
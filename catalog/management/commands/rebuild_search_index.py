@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from catalog.search import search_backend
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index for the configured search backend'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Rebuilding search index with {search_backend.__class__.__name__}...')
+        search_backend.rebuild()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from catalog.inventory import release_expired
+
+class Command(BaseCommand):
+    help = 'Return stock held by expired cart reservations (run every minute or so from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of holds released per transaction (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for released in release_expired(batch_size=options['batch_size']):
+            total += released
+            self.stdout.write(f'Released {total} holds...')
+
+        self.stdout.write(self.style.SUCCESS(f'Released {total} expired holds'))
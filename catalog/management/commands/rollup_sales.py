@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from catalog import rollups
+
+class Command(BaseCommand):
+    help = 'Add orders not yet counted to the sales rollups (safe to run any time, e.g. hourly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of orders rolled up per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Empty the rollups and recompute them from every order'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rollups.rebuild()
+            self.stdout.write('Cleared sales rollups')
+
+        total = 0
+        for added in rollups.roll_up(batch_size=options['batch_size']):
+            total += added
+            self.stdout.write(f'Rolled up {total} orders...')
+
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {total} orders'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalog import inventory
+from catalog.models import ProductVariant
+from catalog.signals import stock_changed
+
+class Command(BaseCommand):
+    help = 'Split the stock of hot variants across counter shards, rebalance them, or fold them back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('skus', nargs='+', help='SKUs of the variants to change')
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--shards', type=int, help='Number of shards to split stock across')
+        group.add_argument('--rebalance', action='store_true', help='Even out stock across existing shards')
+        group.add_argument('--off', action='store_true', help='Move stock back into inventory_count')
+
+    def handle(self, *args, **options):
+        variants = list(ProductVariant.objects.filter(sku__in=options['skus']))
+        missing = set(options['skus']) - {variant.sku for variant in variants}
+        if missing:
+            raise CommandError(f'Unknown SKUs: {", ".join(sorted(missing))}')
+        if options['shards'] is not None and options['shards'] < 1:
+            raise CommandError('--shards must be at least 1')
+
+        for variant in variants:
+            if options['off']:
+                inventory.disable_sharding(variant)
+            elif not variant.is_sharded and options['rebalance']:
+                raise CommandError(f'{variant.sku} is not sharded')
+            elif options['rebalance']:
+                inventory.rebalance(variant)
+            else:
+                inventory.enable_sharding(variant, options['shards'])
+            self.stdout.write(f'Updated {variant.sku}')
+
+        stock_changed.send(sender=ProductVariant, product_ids={variant.product_id for variant in variants})
+        self.stdout.write(self.style.SUCCESS(f'Updated {len(variants)} variants'))
@@ -0,0 +1,51 @@
+from django.conf import settings
+
+from . import carts
+from .models import Cart
+
+
+class AnonymousCartMiddleware:
+    """
+    Keep an anonymous visitor's cart in a signed cookie (catalog.carts.DraftCart)
+    as `request.anonymous_cart`, so browsing and filling a cart write nothing
+    to the database, and merge it into the user's Cart on their first
+    authenticated request.
+
+    Requests without the cookie are passed straight through.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie_name = getattr(settings, 'CATALOG_ANONYMOUS_CART_COOKIE', 'catalog_cart')
+        self.max_age = getattr(settings, 'CATALOG_ANONYMOUS_CART_AGE', 30 * 24 * 60 * 60)
+
+    def __call__(self, request):
+        cookie = request.COOKIES.get(self.cookie_name)
+        request.anonymous_cart = carts.DraftCart.from_cookie(cookie, max_age=self.max_age)
+
+        # Before the view for session logins; after it for a login made by
+        # the view itself or by DRF authentication
+        merged = bool(cookie) and self.merge(request)
+        response = self.get_response(request)
+        merged = merged or (bool(cookie) and self.merge(request))
+
+        if merged:
+            response.delete_cookie(self.cookie_name)
+        elif request.anonymous_cart.changed:
+            if request.anonymous_cart.lines:
+                response.set_cookie(
+                    self.cookie_name, request.anonymous_cart.to_cookie(), max_age=self.max_age,
+                    secure=request.is_secure(), httponly=True, samesite='Lax',
+                )
+            else:
+                response.delete_cookie(self.cookie_name)
+        return response
+
+    def merge(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return False
+        if request.anonymous_cart.lines:
+            cart, created = Cart.objects.get_or_create(user=user)
+            carts.merge(cart, request.anonymous_cart.lines)
+            request.anonymous_cart = carts.DraftCart()
+        return True
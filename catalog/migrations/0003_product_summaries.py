@@ -0,0 +1,100 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:23
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Exists, ExpressionWrapper, F, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def populate_summaries(apps, schema_editor):
+    # ProductQuerySet.refresh_summaries() as of this migration, over the
+    # historical models, so existing products list with prices, images and
+    # ratings straight away
+    Product = apps.get_model('catalog', 'Product')
+    ProductVariant = apps.get_model('catalog', 'ProductVariant')
+    ProductImage = apps.get_model('catalog', 'ProductImage')
+    ProductReview = apps.get_model('catalog', 'ProductReview')
+
+    def final_price(aggregate):
+        modifiers = (
+            ProductVariant.objects.filter(product=OuterRef('pk'), is_active=True)
+            .values('product').annotate(modifier=aggregate('price_modifier')).values('modifier')
+        )
+        return ExpressionWrapper(
+            F('base_price') + Coalesce(Subquery(modifiers), Value(Decimal('0'))),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+
+    primary = (
+        ProductImage.objects.filter(product=OuterRef('pk'), is_primary=True)
+        .order_by('created_at', 'pk').values('pk')[:1]
+    )
+    ratings = ProductReview.objects.filter(product=OuterRef('pk')).values('product')
+    Product.objects.update(
+        min_price=final_price(Min),
+        max_price=final_price(Max),
+        in_stock=Exists(ProductVariant.objects.filter(product=OuterRef('pk'), is_active=True, inventory_count__gt=0)),
+        primary_image=Subquery(primary),
+        review_count=Coalesce(Subquery(ratings.annotate(c=Count('pk')).values('c')), 0),
+        rating_sum=Coalesce(Subquery(ratings.annotate(s=Sum('rating')).values('s')), 0),
+    )
+    Product.objects.update(average_rating=ExpressionWrapper(
+        Coalesce(Cast(F('rating_sum'), models.FloatField()) / NullIf(F('review_count'), 0), 0.0),
+        output_field=models.DecimalField(max_digits=3, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_coupon_order_userprofile_wishlist_orderitem_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.productimage'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['min_price'], name='product_min_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['average_rating'], name='product_avg_rating_idx'),
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
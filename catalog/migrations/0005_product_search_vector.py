@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:25
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# The GIN index and the initial search documents are PostgreSQL-only; other
+# databases fall back to catalog.search.DatabaseSearchBackend.
+
+CREATE_INDEX = "CREATE INDEX product_search_vector_gin ON catalog_product USING gin (search_vector);"
+
+POPULATE = """
+UPDATE catalog_product AS p SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, coalesce(p.name, '')), 'A') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce(p.description, '')), 'B') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce(c.name, '')), 'C')
+FROM catalog_category AS c
+WHERE c.id = p.category_id;
+"""
+
+DROP_INDEX = "DROP INDEX IF EXISTS product_search_vector_gin;"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        # The same text search configuration as catalog.search.PostgresSearchBackend
+        schema_editor.execute(POPULATE, {'config': getattr(settings, 'CATALOG_SEARCH_CONFIG', 'english')})
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+PATH_STEP = 10
+
+
+def populate_paths(apps, schema_editor):
+    Category = apps.get_model('catalog', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+
+    def path_of(pk):
+        segment = str(pk).zfill(PATH_STEP)
+        parent_id = parents[pk]
+        return path_of(parent_id) + segment if parent_id else segment
+
+    for pk in parents:
+        path = path_of(pk)
+        Category.objects.filter(pk=pk).update(path=path, depth=len(path) // PATH_STEP - 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_product_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=250),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_histogram(apps, schema_editor):
+    # As ProductQuerySet.refresh_rating_summary() fills them
+    Product = apps.get_model('catalog', 'Product')
+    ProductReview = apps.get_model('catalog', 'ProductReview')
+    ratings = ProductReview.objects.filter(product=OuterRef('pk')).values('product')
+    Product.objects.update(**{
+        f'rating_{star}_count': Coalesce(
+            Subquery(ratings.filter(rating=star).annotate(c=Count('pk')).values('c')), 0
+        )
+        for star in range(1, 6)
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_category_materialized_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', '-created_at', '-id'], name='review_product_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', '-helpful_votes', '-created_at', '-id'], name='review_product_helpful_idx'),
+        ),
+        migrations.RunPython(populate_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def reset_rollups(apps, schema_editor):
+    # Existing rollups have no units per day or hourly rows; empty them and
+    # mark every order pending so that rollup_sales rebuilds them
+    for name in ['DailySales', 'DailyProductSales', 'ProductSales']:
+        apps.get_model('catalog', name).objects.all().delete()
+    apps.get_model('catalog', 'Order').objects.filter(is_rolled_up=True).update(is_rolled_up=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(unique=True)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'hourly sales',
+            },
+        ),
+        migrations.AddField(
+            model_name='dailysales',
+            name='units',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='HourlyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_sales', to='catalog.product')),
+            ],
+            options={
+                'verbose_name_plural': 'hourly product sales',
+                'indexes': [models.Index(fields=['product', 'hour'], name='hourly_product_sales_idx')],
+                'unique_together': {('hour', 'product')},
+            },
+        ),
+        migrations.RunPython(reset_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_hourly_sales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -1,36 +1,366 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import (
+    Count, Exists, ExpressionWrapper, F, Max, Min, OuterRef, Q, Subquery, Sum, Value
+)
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf, Substr
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+from django.utils.functional import cached_property
 
 class Category(models.Model):
+    # Materialized path: the fixed-width ids of every ancestor and then the
+    # category itself, so a subtree is a single indexed prefix match.
+    PATH_STEP = 10
+
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    path = models.CharField(max_length=250, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Derived from the parent's row in save(); excluded from regular saves so
+    # a stale in-memory instance can never write back an old path
+    MAINTAINED_FIELDS = ['path', 'depth']
     
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
         
     def __str__(self):
         return self.name
 
+    @classmethod
+    def path_segment(cls, pk):
+        return str(pk).zfill(cls.PATH_STEP)
+
+    @classmethod
+    def ids_from_path(cls, path):
+        return [int(path[i:i + cls.PATH_STEP]) for i in range(0, len(path), cls.PATH_STEP)]
+
+    @classmethod
+    def max_depth(cls):
+        """Deepest depth a path of fixed-width segments fits in"""
+        return cls._meta.get_field('path').max_length // cls.PATH_STEP - 1
+
+    def parent_error(self, parent):
+        """Why `parent` cannot be this category's parent, or None if it can"""
+        if parent is None:
+            return None
+        if self.pk and self.pk in self.ids_from_path(parent.path):
+            return 'A category cannot be moved under itself or one of its descendants.'
+        # The whole subtree moves along, so its deepest category must still fit
+        height = 0
+        if self.pk:
+            deepest = Category.objects.filter(path__startswith=self.path).aggregate(depth=Max('depth'))['depth']
+            height = (deepest or self.depth) - self.depth
+        if parent.depth + 1 + height > self.max_depth():
+            return f'Categories can be nested at most {self.max_depth() + 1} levels deep.'
+        return None
+
+    def clean(self):
+        super().clean()
+        if self.parent_id:
+            error = self.parent_error(Category.objects.filter(pk=self.parent_id).first())
+            if error:
+                raise ValidationError({'parent': error})
+
+    def save(self, *args, **kwargs):
+        parent_path, parent_depth = '', -1
+        if self.parent_id:
+            parent_path, parent_depth = Category.objects.filter(pk=self.parent_id).values_list('path', 'depth').get()
+        previous_path, previous_depth = '', 0
+        if not self._state.adding:
+            previous_path, previous_depth = (
+                Category.objects.filter(pk=self.pk).values_list('path', 'depth').first() or ('', 0)
+            )
+            if self.pk in self.ids_from_path(parent_path):
+                raise ValueError('A category cannot be moved under itself or one of its descendants.')
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+                ]
+
+        # Read by catalog.signals, whose post_save runs before the path below
+        # is written, for the listings the category leaves
+        self._previous_path = previous_path
+        super().save(*args, **kwargs)
+
+        path = parent_path + self.path_segment(self.pk)
+        depth = parent_depth + 1
+        if path != previous_path or depth != previous_depth:
+            Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        if previous_path and previous_path != path:
+            # Re-root the whole subtree in one statement
+            Category.objects.filter(path__startswith=previous_path).exclude(pk=self.pk).update(
+                path=Concat(Value(path), Substr('path', len(previous_path) + 1)),
+                depth=F('depth') + (depth - previous_depth),
+            )
+        self.path, self.depth = path, depth
+
+    def get_descendants(self, include_self=True):
+        descendants = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
+RATING_STARS = range(1, 6)
+
+# Sort keys accepted by the catalog listings, each mapped to an ordering that
+# one of the Product indexes serves with an index scan (after is_active=True).
+# `relevance` needs the rank annotation added by catalog.search.
+PRODUCT_SORTS = {
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    'base_price': ('base_price', 'id'),
+    '-base_price': ('-base_price', '-id'),
+    'min_price': ('min_price', 'id'),
+    '-min_price': ('-min_price', '-id'),
+    'rating': ('-average_rating', '-review_count', '-id'),
+    'relevance': ('-rank', '-id'),
+}
+
+class ProductQuerySet(models.QuerySet):
+    def _variant_modifier(self, aggregate):
+        modifiers = (
+            ProductVariant.objects
+            .filter(product=OuterRef('pk'), is_active=True)
+            .values('product')
+            .annotate(modifier=aggregate('price_modifier'))
+            .values('modifier')
+        )
+        return ExpressionWrapper(
+            F('base_price') + Coalesce(Subquery(modifiers), Value(Decimal('0'))),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+
+    def in_category(self, category_id):
+        """Products in a category or any of its descendants"""
+        path = Category.objects.filter(pk=category_id).values_list('path', flat=True).first()
+        if path is None:
+            return self.none()
+        return self.filter(category__path__startswith=path)
+
+    def priced_between(self, min_price=None, max_price=None):
+        """
+        The listing price filter, on the from-price summary (min_price) that
+        the price facet buckets, so a bucket's count is what selecting it lists
+        """
+        queryset = self
+        if min_price:
+            queryset = queryset.filter(min_price__gte=min_price)
+        if max_price:
+            queryset = queryset.filter(min_price__lte=max_price)
+        return queryset
+
+    def sorted_by(self, sort):
+        """Order by one of PRODUCT_SORTS; raises KeyError for anything else"""
+        return self.order_by(*PRODUCT_SORTS[sort])
+
+    def for_listing(self):
+        """Everything ProductListSerializer needs, in a fixed number of queries"""
+        return self.select_related('category', 'primary_image').defer('search_vector')
+
+    # Summary maintenance. These run as set-based UPDATEs so they never load
+    # products into memory and never fire save signals.
+
+    def _in_stock(self):
+        in_stock_variants = ProductVariant.objects.filter(
+            product=OuterRef('pk'), is_active=True, inventory_count__gt=0
+        )
+        in_stock_shards = InventoryShard.objects.filter(
+            variant__product=OuterRef('pk'), variant__is_active=True, count__gt=0
+        )
+        return ExpressionWrapper(
+            Exists(in_stock_variants) | Exists(in_stock_shards), output_field=models.BooleanField()
+        )
+
+    def refresh_price_summary(self):
+        return self.update(
+            min_price=self._variant_modifier(Min),
+            max_price=self._variant_modifier(Max),
+            in_stock=self._in_stock(),
+        )
+
+    def refresh_stock_summary(self):
+        """
+        Update in_stock where it no longer holds, for stock changes that move
+        no price; returns the ids of the products that went in or out of stock.
+        A read, and only when some did an UPDATE, so selling or holding stock
+        rarely writes the product row.
+        """
+        flipped = list(
+            self.annotate(in_stock_now=self._in_stock()).exclude(in_stock=F('in_stock_now'))
+            .values_list('pk', flat=True)
+        )
+        if flipped:
+            Product.objects.filter(pk__in=flipped).update(in_stock=self._in_stock())
+        return flipped
+
+    def refresh_primary_image(self):
+        primary = (
+            ProductImage.objects
+            .filter(product=OuterRef('pk'), is_primary=True)
+            .order_by('created_at', 'pk')
+            .values('pk')[:1]
+        )
+        return self.update(primary_image=Subquery(primary))
+
+    def refresh_rating_summary(self):
+        ratings = (
+            ProductReview.objects
+            .filter(product=OuterRef('pk'))
+            .values('product')
+        )
+
+        def count(**filters):
+            return Coalesce(Subquery(ratings.filter(**filters).annotate(c=Count('pk')).values('c')), 0)
+
+        self.update(
+            review_count=count(),
+            rating_sum=Coalesce(Subquery(ratings.annotate(s=Sum('rating')).values('s')), 0),
+            **{Product.rating_count_field(star): count(rating=star) for star in RATING_STARS},
+        )
+        return self.update(average_rating=_average_rating(F('rating_sum'), F('review_count')))
+
+    def refresh_summaries(self):
+        self.refresh_price_summary()
+        self.refresh_primary_image()
+        return self.refresh_rating_summary()
+
+    def touch(self):
+        return self.update(updated_at=timezone.now())
+
+    def apply_review_change(self, removed_rating=None, added_rating=None):
+        """Incrementally fold a review insert/update/delete into the rating summary"""
+        count_delta = (added_rating is not None) - (removed_rating is not None)
+        rating_delta = (added_rating or 0) - (removed_rating or 0)
+        histogram = {}
+        if removed_rating != added_rating:
+            if removed_rating is not None:
+                field = Product.rating_count_field(removed_rating)
+                histogram[field] = F(field) - 1
+            if added_rating is not None:
+                field = Product.rating_count_field(added_rating)
+                histogram[field] = F(field) + 1
+        return self.update(
+            review_count=F('review_count') + count_delta,
+            rating_sum=F('rating_sum') + rating_delta,
+            average_rating=_average_rating(
+                F('rating_sum') + rating_delta, F('review_count') + count_delta
+            ),
+            **histogram,
+        )
+
+def _average_rating(rating_sum, review_count):
+    return ExpressionWrapper(
+        Coalesce(Cast(rating_sum, models.FloatField()) / NullIf(review_count, 0), 0.0),
+        output_field=models.DecimalField(max_digits=3, decimal_places=2),
+    )
+
 class Product(models.Model):
+    # Maintained by catalog.signals; excluded from regular saves so a stale
+    # in-memory instance can never overwrite them.
+    MAINTAINED_FIELDS = [
+        'min_price', 'max_price', 'in_stock',
+        'review_count', 'rating_sum', 'average_rating', 'primary_image',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+        'search_vector',
+    ]
+
     name = models.CharField(max_length=200)
+    # Natural key for catalog feeds, see catalog.importer
+    sku = models.CharField(max_length=100, unique=True, null=True, blank=True)
     description = models.TextField()
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     base_price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also touched when variants, images or reviews change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Denormalized summaries
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    in_stock = models.BooleanField(default=False, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    primary_image = models.ForeignKey(
+        'ProductImage', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', editable=False
+    )
+
+    # Full-text search document, see catalog.search.PostgresSearchBackend
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listings filter on is_active=True and seek on (sort key, id); see
+            # PRODUCT_SORTS. Partial rather than led by is_active because
+            # Django compiles the filter to a bare `WHERE is_active`, which
+            # SQLite cannot match against an index column.
+            models.Index(
+                fields=['-created_at', '-id'], condition=Q(is_active=True), name='product_active_created_idx'
+            ),
+            models.Index(fields=['name', 'id'], condition=Q(is_active=True), name='product_active_name_idx'),
+            models.Index(
+                fields=['base_price', 'id'], condition=Q(is_active=True), name='product_active_price_idx'
+            ),
+            models.Index(
+                fields=['min_price', 'id'], condition=Q(is_active=True), name='product_active_min_price_idx'
+            ),
+            models.Index(
+                fields=['-average_rating', '-review_count', '-id'], condition=Q(is_active=True),
+                name='product_active_rating_idx',
+            ),
+            # Category pages filtered by price; see ProductQuerySet.priced_between
+            models.Index(
+                fields=['category', 'min_price'], condition=Q(is_active=True), name='product_category_min_price_idx'
+            ),
+        ]
         
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def rating_count_field(star):
+        return f'rating_{star}_count'
+
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, self.rating_count_field(star)) for star in RATING_STARS}
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.min_price = self.max_price = self.base_price
+        elif kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='product_images/')
@@ -50,11 +380,31 @@ class ProductVariant(models.Model):
     sku = models.CharField(max_length=100, unique=True)
     price_modifier = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     inventory_count = models.PositiveIntegerField(default=0)
+    # Units held by active carts, see catalog.inventory
+    reserved_count = models.PositiveIntegerField(default=0, editable=False)
+    # Number of InventoryShard rows holding the stock of a hot variant
+    # instead of inventory_count; 0 means not sharded
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    # Maintained by catalog.inventory; excluded from regular saves
+    MAINTAINED_FIELDS = ['reserved_count', 'stock_shards']
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Price summary and variant listings only ever look at active
+            # variants of one product
+            models.Index(
+                fields=['product', 'price_modifier'], condition=Q(is_active=True),
+                name='variant_active_price_idx',
+            ),
+            models.Index(
+                fields=['product'], condition=Q(is_active=True, inventory_count__gt=0),
+                name='variant_active_in_stock_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.name}"
@@ -63,25 +413,95 @@ class ProductVariant(models.Model):
     def final_price(self):
         return self.product.base_price + self.price_modifier
 
+    @property
+    def is_sharded(self):
+        return self.stock_shards > 0
+
+    @property
+    def on_hand(self):
+        """Units in stock, summed over the shards of a sharded variant"""
+        if self.is_sharded:
+            return sum(shard.count for shard in self.shards.all())
+        return self.inventory_count
+
+    @property
+    def available_count(self):
+        """Available to sell: on hand minus what carts are holding"""
+        if self.is_sharded:
+            # Holds on sharded variants are taken out of the shards
+            return self.on_hand
+        return max(self.inventory_count - self.reserved_count, 0)
+
     @property
     def is_in_stock(self):
-        return self.inventory_count > 0
+        return self.available_count > 0
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+class InventoryShard(models.Model):
+    """One of the counters a sharded variant's stock is split across, see catalog.inventory"""
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['variant', 'shard']
+
+    def __str__(self):
+        return f"{self.variant} shard {self.shard}: {self.count}"
+
+def cart_totals(prefix=''):
+    """Item count and subtotal aggregates over cart lines reached through `prefix`"""
+    quantity = F(f'{prefix}quantity')
+    price = F(f'{prefix}variant__product__base_price') + F(f'{prefix}variant__price_modifier')
+    return {
+        'item_count': Coalesce(Sum(quantity), 0),
+        'subtotal': Coalesce(
+            Sum(quantity * price, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal('0')),
+        ),
+    }
+
+class CartItemQuerySet(models.QuerySet):
+    def totals(self):
+        """{'item_count', 'subtotal'} of these lines, in one aggregate query"""
+        return self.aggregate(**cart_totals())
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate each cart's item_count and subtotal in the same query"""
+        return self.annotate(**cart_totals('items__'))
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    @cached_property
+    def totals(self):
+        # Annotated by Cart.objects.with_totals(), otherwise one aggregate query
+        if hasattr(self, 'item_count'):
+            return {'item_count': self.item_count, 'subtotal': self.subtotal}
+        return self.items.totals()
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.totals['item_count']
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.totals['subtotal']
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -89,6 +509,8 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ['cart', 'variant']
 
@@ -99,6 +521,20 @@ class CartItem(models.Model):
     def total_price(self):
         return self.variant.final_price * self.quantity
 
+class InventoryHold(models.Model):
+    """Stock set aside for a cart until it expires, see catalog.inventory"""
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='holds')
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='holds')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['cart', 'variant']
+
+    def __str__(self):
+        return f"{self.quantity}x {self.variant} held for {self.cart}"
+
 # Additional E-commerce Models
 
 class Order(models.Model):
@@ -114,15 +550,22 @@ class Order(models.Model):
     order_number = models.CharField(max_length=20, unique=True)
     status = models.CharField(max_length=20, choices=ORDER_STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    coupon = models.ForeignKey('Coupon', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     shipping_address = models.TextField()
     billing_address = models.TextField()
     payment_method = models.CharField(max_length=50, default='credit_card')
     payment_status = models.CharField(max_length=20, default='pending')
+    # Set once the order is counted in the sales rollups, see catalog.rollups
+    is_rolled_up = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['id'], condition=Q(is_rolled_up=False), name='order_pending_rollup_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.order_number} - {self.user.username}"
@@ -143,6 +586,83 @@ class OrderItem(models.Model):
     def total_price(self):
         return self.price * self.quantity
 
+# Sales rollups, maintained incrementally by catalog.rollups so reporting
+# never scans the order history
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily sales'
+
+    def __str__(self):
+        return f"{self.date}: {self.order_count} orders, {self.revenue}"
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'product']
+        verbose_name_plural = 'daily product sales'
+        indexes = [
+            models.Index(fields=['product', 'date'], name='daily_product_sales_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.units}x {self.product}"
+
+class HourlySales(models.Model):
+    hour = models.DateTimeField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'hourly sales'
+
+    def __str__(self):
+        return f"{self.hour}: {self.order_count} orders, {self.revenue}"
+
+class HourlyProductSales(models.Model):
+    hour = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='hourly_sales')
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['hour', 'product']
+        verbose_name_plural = 'hourly product sales'
+        indexes = [
+            models.Index(fields=['product', 'hour'], name='hourly_product_sales_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour}: {self.units}x {self.product}"
+
+class ProductSales(models.Model):
+    """Lifetime totals per product, so top sellers are read without summing every day"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'product sales'
+        indexes = [
+            models.Index(fields=['-order_count'], name='product_sales_orders_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product}: {self.order_count} orders"
+
 class ProductReview(models.Model):
     RATING_CHOICES = [
         (1, '1 Star'),
@@ -165,6 +685,11 @@ class ProductReview(models.Model):
     class Meta:
         unique_together = ['product', 'user']
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a product's reviews by recency and helpfulness
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_recent_idx'),
+            models.Index(fields=['product', '-helpful_votes', '-created_at', '-id'], name='review_product_helpful_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.product.name} ({self.rating} stars)"
@@ -202,9 +727,20 @@ class Coupon(models.Model):
     valid_from = models.DateTimeField()
     valid_until = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+    # Counted by catalog.coupons.redeem(); excluded from regular saves
+    MAINTAINED_FIELDS = ['used_count']
     
     def __str__(self):
         return f"Coupon {self.code} - {self.discount_value}% off"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
     
     @property
     def is_valid(self):
@@ -0,0 +1,161 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the ordering columns instead of using
+    OFFSET, so every page costs the same as the first one.
+
+    The ordering is taken from the queryset and always ends with the primary
+    key as a tiebreaker. The cursor is an opaque token holding the ordering
+    values of the last row on the previous page.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+
+        cursor = self.decode_cursor(request, queryset)
+        if cursor is not None:
+            queryset = queryset.filter(self.seek_predicate(cursor))
+
+        results = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        fields = [field.lstrip('-') for field in ordering]
+        for field in fields:
+            if not self._is_seekable(queryset, field):
+                raise ValidationError({'sort': f'Ordering by "{field}" is not supported with cursor pagination'})
+        if 'pk' not in fields and 'id' not in fields:
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    def _is_seekable(self, queryset, field):
+        if field in ('pk', 'id') or field in queryset.query.annotations:
+            return True
+        try:
+            return queryset.model._meta.get_field(field).concrete
+        except FieldDoesNotExist:
+            return False
+
+    def seek_predicate(self, values):
+        """
+        Rows strictly after `values` in ordering order, written as
+        `a >= x AND (a > x OR (a = x AND b > y) ...)` so the leading column
+        can drive an index range scan.
+        """
+        predicate = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            predicate |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        first = self.ordering[0]
+        leading = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+        return leading & predicate
+
+    def get_next_link(self):
+        url = self.request.build_absolute_uri()
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [getattr(last, field.lstrip('-')) for field in self.ordering]
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def encode_cursor(self, values):
+        def default(value):
+            if isinstance(value, (datetime.datetime, datetime.date)):
+                return value.isoformat()
+            if isinstance(value, Decimal):
+                return str(value)
+            raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+        data = json.dumps(values, default=default, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        except (binascii.Error, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        decoded = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            if name in queryset.query.annotations:
+                decoded.append(value)
+                continue
+            model_field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+            try:
+                decoded.append(model_field.to_python(value))
+            except DjangoValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return decoded
+
+
+def use_keyset_pagination(request):
+    """Cursor mode is opt-in with ?pagination=cursor, or implied by a cursor token"""
+    params = request.query_params
+    return params.get('pagination') == 'cursor' or bool(params.get(KeysetPagination.cursor_query_param))
+
+
+def get_product_paginator(request):
+    if use_keyset_pagination(request):
+        return KeysetPagination()
+    return PageNumberPagination()
@@ -0,0 +1,144 @@
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .db import bulk_increment_or_create
+from .models import (
+    DailyProductSales, DailySales, HourlyProductSales, HourlySales, Order, OrderItem, ProductSales,
+)
+
+# Sales rollups.
+#
+# Orders are added to the hourly, daily and lifetime rollups exactly once: a
+# batch of orders with is_rolled_up=False is claimed with skip_locked, its
+# totals are added to the rollup rows with increment upserts, and the
+# orders are flagged, all in one transaction. Checkout rolls up each order
+# right after it commits; the rollup_sales command catches up anything that
+# missed that, so running either any number of times, or both at once,
+# never counts an order twice.
+#
+# Hours and days are in the current time zone. Order counts are by order
+# (and per product, by orders containing it); revenue is what was charged.
+# Per product it is each line's share of its order's total, so a coupon
+# discount is split across the lines in proportion to their price and the
+# product revenues of an hour add up to its total revenue.
+
+COUNTERS = ['order_count', 'units', 'revenue']
+CENT = Decimal('0.01')
+
+
+def net_line_revenue(lines):
+    """
+    Yield (line, revenue) for OrderItem value rows with 'order', 'price',
+    'quantity' and 'order__total_amount', grouped by order and holding every
+    line of each order: the order's total split across its lines in
+    proportion to price * quantity, rounded to the cent so the lines add up
+    to the total exactly.
+    """
+    for _, order_lines in groupby(lines, key=lambda line: line['order']):
+        order_lines = list(order_lines)
+        total = order_lines[0]['order__total_amount']
+        subtotal = sum(line['price'] * line['quantity'] for line in order_lines)
+        # Round the running total rather than each line, so no cent is lost
+        running = allocated = Decimal(0)
+        for line in order_lines:
+            running += line['price'] * line['quantity']
+            share = (total * running / subtotal).quantize(CENT, ROUND_HALF_UP) if subtotal else Decimal(0)
+            yield line, share - allocated
+            allocated = share
+
+
+def _add(buckets, key, values, **row):
+    totals = buckets.setdefault(key, {**row, 'order_count': 0, 'units': 0, 'revenue': 0})
+    for field in COUNTERS:
+        totals[field] += values.get(field, 0)
+
+
+def roll_up(order_ids=None, batch_size=1000):
+    """
+    Add pending orders (all of them, or those among `order_ids`) to the
+    rollups in batches; yields the number of orders added per batch.
+    """
+    while True:
+        with transaction.atomic():
+            pending = Order.objects.select_for_update(skip_locked=True).filter(is_rolled_up=False)
+            if order_ids is not None:
+                pending = pending.filter(pk__in=order_ids)
+            batch = list(pending.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return
+
+            # Orders grouped by hour, and their lines grouped by hour and product
+            # once the totals are split across them; days and lifetime totals
+            # are sums of hours
+            orders = (
+                Order.objects.filter(pk__in=batch)
+                .annotate(hour=TruncHour('created_at'))
+                .values('hour')
+                .annotate(order_count=Count('pk'), revenue=Sum('total_amount'))
+                .order_by()
+            )
+            lines = (
+                OrderItem.objects.filter(order__in=batch)
+                .annotate(hour=TruncHour('order__created_at'), product=F('variant__product'))
+                .values('order', 'hour', 'product', 'price', 'quantity', 'order__total_amount')
+                .order_by('order', 'pk')
+            )
+            products = {}
+            for line, revenue in net_line_revenue(lines):
+                row = products.setdefault(
+                    (line['hour'], line['product']), {'orders': set(), 'units': 0, 'revenue': 0}
+                )
+                row['orders'].add(line['order'])
+                row['units'] += line['quantity']
+                row['revenue'] += revenue
+
+            hourly, daily, hourly_products, daily_products, lifetime = {}, {}, {}, {}, {}
+            for row in orders:
+                day = timezone.localtime(row['hour']).date()
+                _add(hourly, row['hour'], row, hour=row['hour'])
+                _add(daily, day, row, date=day)
+            for (hour, product_id), row in products.items():
+                row['order_count'] = len(row.pop('orders'))
+                day = timezone.localtime(hour).date()
+                units = {'units': row['units']}
+                _add(hourly, hour, units, hour=hour)
+                _add(daily, day, units, date=day)
+                _add(hourly_products, (hour, product_id), row, hour=hour, product_id=product_id)
+                _add(daily_products, (day, product_id), row, date=day, product_id=product_id)
+                _add(lifetime, product_id, row, product_id=product_id)
+
+            for model, buckets, unique_fields in [
+                (HourlySales, hourly, ['hour']),
+                (DailySales, daily, ['date']),
+                (HourlyProductSales, hourly_products, ['hour', 'product']),
+                (DailyProductSales, daily_products, ['date', 'product']),
+                (ProductSales, lifetime, ['product']),
+            ]:
+                bulk_increment_or_create(
+                    model, list(buckets.values()), unique_fields=unique_fields, increment_fields=COUNTERS,
+                )
+
+            Order.objects.filter(pk__in=batch).update(is_rolled_up=True)
+        yield len(batch)
+
+
+def roll_up_order(order_id):
+    """Roll up one new order; called by checkout once it commits"""
+    for _ in roll_up([order_id]):
+        pass
+
+
+def rebuild():
+    """Empty the rollups and mark every order pending, to be rolled up again"""
+    with transaction.atomic():
+        HourlySales.objects.all().delete()
+        DailySales.objects.all().delete()
+        HourlyProductSales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        ProductSales.objects.all().delete()
+        Order.objects.filter(is_rolled_up=True).update(is_rolled_up=False)
@@ -0,0 +1,324 @@
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+from .inverted_index import InvertedIndex
+from .models import Category, Product
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class BaseSearchBackend:
+    """
+    Product search backends filter a Product queryset by a free-text query
+    and annotate it with a float `rank` (higher is more relevant), which
+    listing views can sort and keyset-paginate on.
+
+    Backends that keep their own index are told about catalog changes
+    through update_products/remove_products (see catalog.signals).
+    """
+
+    def search(self, queryset, query, include_category=True):
+        raise NotImplementedError
+
+    def partitions(self, queryset, query, include_category=True):
+        """
+        Disjoint querysets that together hold every match of `query` in
+        `queryset`, for aggregates (facets) over the whole result set even
+        where search() caps it.
+        """
+        return [self.search(queryset, query, include_category=include_category)]
+
+    def without_search(self, queryset):
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+    def update_products(self, queryset):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Portable substring search; ranks name matches above the rest"""
+
+    def search(self, queryset, query, include_category=True):
+        condition = Q(name__icontains=query) | Q(description__icontains=query)
+        if include_category:
+            condition |= Q(category__name__icontains=query)
+        return queryset.filter(condition).annotate(
+            rank=Case(
+                When(name__icontains=query, then=Value(1.0)),
+                When(description__icontains=query, then=Value(0.4)),
+                default=Value(0.2),
+                output_field=FloatField(),
+            )
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Full-text search over Product.search_vector (GIN indexed). Name is
+    weighted above description, which is weighted above the category name.
+    Every term is matched as a prefix, so partially typed words still hit.
+    """
+
+    def __init__(self):
+        self.config = getattr(settings, 'CATALOG_SEARCH_CONFIG', 'english')
+
+    def build_query(self, query, labels=''):
+        """Prefix match of every term, only in the given weights (e.g. 'AB') if any"""
+        terms = tokenize(query)
+        if not terms:
+            return None
+        return SearchQuery(
+            ' & '.join(f'{term}:*{labels}' for term in terms),
+            search_type='raw',
+            config=self.config,
+        )
+
+    def search(self, queryset, query, include_category=True):
+        # Without the category, terms must match the name or description
+        search_query = self.build_query(query, labels='' if include_category else 'AB')
+        if search_query is None:
+            return self.without_search(queryset).none()
+        weights = [0.1, 0.2, 0.4, 1.0]  # D, C, B, A
+        queryset = queryset.filter(search_vector=search_query)
+        return queryset.annotate(
+            # float8 so cursor values round-trip exactly
+            rank=Cast(SearchRank(F('search_vector'), search_query, weights=weights), FloatField())
+        )
+
+    def vector(self, category_name):
+        return (
+            SearchVector('name', weight='A', config=self.config)
+            + SearchVector('description', weight='B', config=self.config)
+            + SearchVector(Value(category_name), weight='C', config=self.config)
+        )
+
+    def update_products(self, queryset):
+        categories = Category.objects.filter(
+            pk__in=queryset.values('category_id')
+        ).values_list('pk', 'name')
+        for category_id, category_name in categories:
+            queryset.filter(category_id=category_id).update(
+                search_vector=self.vector(category_name)
+            )
+
+    def rebuild(self):
+        self.update_products(Product.objects.all())
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """
+    Database-independent search answered from an in-process inverted index
+    (catalog.inverted_index). The index ranks every match; the queryset's
+    filters (active, category, price...) are then checked in the database a
+    chunk of ranked ids at a time, until the best `max_candidates` matches
+    that pass them are found. Callers therefore search an already filtered
+    queryset. partitions() covers all matches, uncapped, for facets.
+
+    Each process keeps its own index. Writes in the process are applied
+    directly and bump a version in the shared cache; other processes, and
+    one starting from a snapshot, catch up by re-reading the products (or
+    their categories) updated since the index was last synced, in a
+    background thread, once the version changes and at least every
+    `refresh_seconds`. Products deleted elsewhere stay listed until the
+    next rebuild, but never come back from search(): every match is
+    checked against the database.
+
+    Settings:
+        CATALOG_SEARCH_INDEX_PATH: snapshot file loaded at startup and
+            written by rebuild_search_index (optional).
+        CATALOG_SEARCH_MAX_CANDIDATES: the most results one search returns.
+        CATALOG_SEARCH_REFRESH: seconds between catch-ups (default 60).
+    """
+
+    chunk_size = 1000
+    version_key = 'catalog:search:version'
+    # Re-read this far back, for writes whose transactions committed after
+    # a catch-up that started later than their updated_at
+    sync_overlap = timedelta(minutes=5)
+
+    def __init__(self, background=True):
+        self.snapshot_path = getattr(settings, 'CATALOG_SEARCH_INDEX_PATH', None)
+        self.max_candidates = getattr(settings, 'CATALOG_SEARCH_MAX_CANDIDATES', 1000)
+        self.refresh_seconds = getattr(settings, 'CATALOG_SEARCH_REFRESH', 60)
+        self.background = background
+        self._index = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    index = InvertedIndex(tokenize)
+                    if self.snapshot_path and index.load(self.snapshot_path):
+                        self._catch_up(index)
+                    else:
+                        self._build(index)
+                    self._index = index
+        return self._index
+
+    def _build(self, index):
+        version, started = self._current_version(), timezone.now()
+        index.build(self._rows(Product.objects.all()))
+        index.synced_at = started
+        self.version, self.checked_at = version, time.monotonic()
+
+    def _catch_up(self, index):
+        version, started = self._current_version(), timezone.now()
+        since = index.synced_at - self.sync_overlap
+        changed = Product.objects.filter(Q(updated_at__gte=since) | Q(category__updated_at__gte=since))
+        for row in self._rows(changed):
+            index.add(*row)
+        index.synced_at = started
+        self.version, self.checked_at = version, time.monotonic()
+
+    def _current_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid.uuid4().hex, None)
+            version = cache.get(self.version_key)
+        return version
+
+    def _changed(self):
+        # Tells the other processes to catch up
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+
+    def is_fresh(self):
+        return (
+            time.monotonic() - self.checked_at < self.refresh_seconds
+            and self._current_version() == self.version
+        )
+
+    def ensure_fresh(self):
+        """The index, with a catch-up started if it may have missed writes made elsewhere"""
+        index = self.index
+        if not self.is_fresh() and self._sync_lock.acquire(blocking=False):
+            if self.background:
+                threading.Thread(target=self._sync, args=(index,), name='search-index', daemon=True).start()
+            else:
+                self._sync(index)
+        return index
+
+    def _sync(self, index):
+        try:
+            self._catch_up(index)
+        finally:
+            self._sync_lock.release()
+            if self.background:
+                connections.close_all()
+
+    def _rows(self, queryset):
+        return (
+            queryset.order_by('pk')
+            .values_list('pk', 'name', 'description', 'category__name')
+            .iterator(chunk_size=2000)
+        )
+
+    def _chunks(self, ranked):
+        for start in range(0, len(ranked), self.chunk_size):
+            yield ranked[start:start + self.chunk_size]
+
+    def search(self, queryset, query, include_category=True):
+        ranked = self.ensure_fresh().search(query, include_category=include_category)
+        candidates = []
+        for chunk in self._chunks(ranked):
+            passing = set(
+                queryset.order_by().filter(pk__in=[doc_id for doc_id, _ in chunk]).values_list('pk', flat=True)
+            )
+            candidates += [(doc_id, score) for doc_id, score in chunk if doc_id in passing]
+            if len(candidates) >= self.max_candidates:
+                break
+        candidates = candidates[:self.max_candidates]
+        if not candidates:
+            return self.without_search(queryset).none()
+
+        # One WHEN per distinct score rather than per product
+        by_score = defaultdict(list)
+        for doc_id, score in candidates:
+            by_score[score].append(doc_id)
+        return queryset.filter(pk__in=[doc_id for doc_id, _ in candidates]).annotate(
+            rank=Case(
+                *[When(pk__in=doc_ids, then=Value(float(score))) for score, doc_ids in by_score.items()],
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+
+    def partitions(self, queryset, query, include_category=True):
+        ranked = self.ensure_fresh().search(query, include_category=include_category)
+        return [queryset.filter(pk__in=[doc_id for doc_id, _ in chunk]) for chunk in self._chunks(ranked)]
+
+    def update_products(self, queryset):
+        index = self.index
+        for row in self._rows(queryset):
+            index.add(*row)
+        self._changed()
+
+    def remove_products(self, product_ids):
+        index = self.index
+        for product_id in product_ids:
+            index.remove(product_id)
+        self._changed()
+
+    def rebuild(self):
+        index = InvertedIndex(tokenize)
+        self._build(index)
+        self._index = index
+        if self.snapshot_path:
+            index.save(self.snapshot_path)
+
+
+def _load_backend():
+    path = getattr(settings, 'CATALOG_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return DatabaseSearchBackend()
+
+
+search_backend = SimpleLazyObject(_load_backend)
+
+
+def search_products_queryset(queryset, query, include_category=True):
+    """
+    Apply the configured search backend, or a neutral rank when there is no
+    query. Search last, after the listing's filters: backends may cap results.
+    """
+    if not query:
+        return search_backend.without_search(queryset)
+    return search_backend.search(queryset, query, include_category=include_category)
+
+
+def search_partitions(queryset, query, include_category=True):
+    """Querysets that together hold every match, uncapped; see BaseSearchBackend.partitions()"""
+    if not query:
+        return [queryset]
+    return search_backend.partitions(queryset, query, include_category=include_category)
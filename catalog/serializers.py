@@ -4,12 +4,19 @@ from .models import (
     Category, Product, ProductImage, ProductVariant, Cart, CartItem,
     Order, OrderItem, ProductReview, Wishlist, WishlistItem, Coupon, UserProfile
 )
+from . import carts, inventory
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'parent', 'is_active', 'created_at']
 
+    def validate_parent(self, parent):
+        error = (self.instance or Category()).parent_error(parent)
+        if error:
+            raise serializers.ValidationError(error)
+        return parent
+
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
@@ -17,11 +24,24 @@ class ProductImageSerializer(serializers.ModelSerializer):
 
 class ProductVariantSerializer(serializers.ModelSerializer):
     final_price = serializers.ReadOnlyField()
+    available_count = serializers.ReadOnlyField()
     is_in_stock = serializers.ReadOnlyField()
 
     class Meta:
         model = ProductVariant
-        fields = ['id', 'name', 'sku', 'price_modifier', 'final_price', 'inventory_count', 'is_in_stock', 'is_active']
+        fields = ['id', 'name', 'sku', 'price_modifier', 'final_price', 'inventory_count', 'available_count',
+                  'is_in_stock', 'is_active']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Sharded variants keep their stock in InventoryShard rows
+        data['inventory_count'] = instance.on_hand
+        return data
+
+    def update(self, instance, validated_data):
+        if instance.is_sharded and 'inventory_count' in validated_data:
+            inventory.set_stock(instance, validated_data.pop('inventory_count'))
+        return super().update(instance, validated_data)
 
 class ProductSerializer(serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
@@ -30,7 +50,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'category', 'category_name', 'base_price', 'is_active', 'images', 'variants', 'created_at']
+        fields = ['id', 'name', 'sku', 'description', 'category', 'category_name', 'base_price', 'is_active', 'images', 'variants', 'created_at']
 
 class ProductListSerializer(serializers.ModelSerializer):
     primary_image = serializers.SerializerMethodField()
@@ -42,23 +62,19 @@ class ProductListSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'name', 'description', 'category_name', 'min_price', 'max_price', 'primary_image', 'is_active']
 
+    # Listing data is read from the summary columns maintained on Product;
+    # use Product.objects.for_listing() to avoid per-row queries.
+
     def get_primary_image(self, obj):
-        primary_image = obj.images.filter(is_primary=True).first()
-        if primary_image:
-            return ProductImageSerializer(primary_image).data
+        if obj.primary_image:
+            return ProductImageSerializer(obj.primary_image).data
         return None
 
     def get_min_price(self, obj):
-        variants = obj.variants.filter(is_active=True)
-        if variants.exists():
-            return min(variant.final_price for variant in variants)
-        return obj.base_price
+        return obj.min_price
 
     def get_max_price(self, obj):
-        variants = obj.variants.filter(is_active=True)
-        if variants.exists():
-            return max(variant.final_price for variant in variants)
-        return obj.base_price
+        return obj.max_price
 
 class CartItemSerializer(serializers.ModelSerializer):
     variant_name = serializers.CharField(source='variant.name', read_only=True)
@@ -79,6 +95,14 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ['id', 'items', 'total_items', 'total_price', 'created_at', 'updated_at']
 
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=carts.OPERATIONS)
+    variant_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
 # Additional Serializers for E-commerce Features
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -119,16 +143,23 @@ class OrderItemSerializer(serializers.ModelSerializer):
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     user = serializers.StringRelatedField(read_only=True)
+    coupon = serializers.SlugRelatedField(slug_field='code', read_only=True)
+    coupon_code = serializers.CharField(max_length=20, required=False, allow_blank=True, write_only=True)
     
     class Meta:
         model = Order
-        fields = ['id', 'order_number', 'status', 'total_amount', 'shipping_address', 'billing_address', 
-                 'payment_method', 'payment_status', 'items', 'user', 'created_at', 'updated_at']
+        fields = ['id', 'order_number', 'status', 'total_amount', 'coupon', 'coupon_code', 'discount_amount',
+                 'shipping_address', 'billing_address', 'payment_method', 'payment_status', 'items', 'user',
+                 'created_at', 'updated_at']
+        # Set by checkout, see catalog.checkout.place_order
+        read_only_fields = ['order_number', 'status', 'total_amount', 'discount_amount', 'payment_status']
 
 class OrderCreateSerializer(serializers.ModelSerializer):
+    coupon_code = serializers.CharField(max_length=20, required=False, allow_blank=True)
+
     class Meta:
         model = Order
-        fields = ['shipping_address', 'billing_address', 'payment_method']
+        fields = ['shipping_address', 'billing_address', 'payment_method', 'coupon_code']
 
 class WishlistItemSerializer(serializers.ModelSerializer):
     product = ProductListSerializer(read_only=True)
@@ -147,7 +178,7 @@ class WishlistSerializer(serializers.ModelSerializer):
         fields = ['id', 'items', 'total_items', 'created_at']
     
     def get_total_items(self, obj):
-        return obj.items.count()
+        return len(obj.items.all())
 
 class CouponSerializer(serializers.ModelSerializer):
     is_valid = serializers.ReadOnlyField()
@@ -166,20 +197,22 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     variants = ProductVariantSerializer(many=True, read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
-    reviews = ProductReviewSerializer(many=True, read_only=True)
+    # Only the most recent reviews; the full list is paginated under /reviews/
+    reviews = ProductReviewSerializer(source='recent_reviews', many=True, read_only=True)
     average_rating = serializers.SerializerMethodField()
     total_reviews = serializers.SerializerMethodField()
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
     
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'category', 'category_name', 'base_price', 'is_active', 
-                 'images', 'variants', 'reviews', 'average_rating', 'total_reviews', 'created_at']
+                 'images', 'variants', 'reviews', 'average_rating', 'total_reviews', 'rating_histogram',
+                 'created_at']
     
     def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return round(sum(review.rating for review in reviews) / len(reviews), 1)
+        if obj.review_count:
+            return round(float(obj.average_rating), 1)
         return 0
     
     def get_total_reviews(self, obj):
-        return obj.reviews.count()
\ No newline at end of file
+        return obj.review_count
\ No newline at end of file
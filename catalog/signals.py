@@ -0,0 +1,220 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from .cache import (
+    CATEGORIES_VERSION, COUPONS_VERSION, PRODUCTS_VERSION,
+    bump_versions, cart_version, category_version, product_version,
+)
+from .models import Cart, CartItem, Category, Coupon, Product, ProductImage, ProductReview, ProductVariant
+from .search import search_backend
+from . import inventory, suggest
+
+# Sent, once committed, by set-based stock writes that bypass ProductVariant
+# save signals (catalog.inventory's holds and releases, checkout, sharding),
+# with the ids of the products whose available stock changed
+stock_changed = Signal()
+
+# Sent, once committed, by set-based cart line writes (catalog.carts,
+# checkout) that bypass CartItem save signals, with the cart owner's id
+cart_changed = Signal()
+
+# Product summary maintenance
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    product = Product.objects.filter(pk=instance.pk)
+    # base_price feeds min/max price
+    if not created:
+        product.refresh_price_summary()
+    search_backend.update_products(product)
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search_backend.remove_products([instance.pk])
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    # Category names are part of the search document
+    if not created and not raw:
+        search_backend.update_products(Product.objects.filter(category=instance))
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Product.objects.filter(pk=instance.product_id).refresh_price_summary()
+
+@receiver(stock_changed)
+def stock_summary_changed(sender, product_ids, **kwargs):
+    # Every hold and sale lands here; only products going in or out of stock
+    # change their row and the listings (in_stock feeds the stock facet)
+    flipped = Product.objects.filter(pk__in=product_ids).refresh_stock_summary()
+    _bump_stock(product_ids, flipped)
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def image_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Product.objects.filter(pk=instance.product_id).refresh_primary_image()
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def product_child_changed(sender, instance, raw=False, **kwargs):
+    # Keeps Product.updated_at usable as the detail page's Last-Modified
+    if not raw:
+        Product.objects.filter(pk=instance.product_id).touch()
+
+@receiver(pre_save, sender=ProductReview)
+def review_pre_save(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = (
+            ProductReview.objects.filter(pk=instance.pk)
+            .values_list('product_id', 'rating')
+            .first()
+        )
+
+@receiver(post_save, sender=ProductReview)
+def review_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if previous:
+        previous_product_id, previous_rating = previous
+        if previous_product_id == instance.product_id:
+            Product.objects.filter(pk=instance.product_id).apply_review_change(
+                removed_rating=previous_rating, added_rating=instance.rating
+            )
+            return
+        Product.objects.filter(pk=previous_product_id).apply_review_change(removed_rating=previous_rating)
+    Product.objects.filter(pk=instance.product_id).apply_review_change(added_rating=instance.rating)
+
+@receiver(post_delete, sender=ProductReview)
+def review_deleted(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).apply_review_change(removed_rating=instance.rating)
+
+# Inventory holds
+
+@receiver(pre_delete, sender=Cart)
+def cart_deleted(sender, instance, **kwargs):
+    # The cascade would drop the holds without returning them to stock
+    inventory.release(instance)
+
+# Typeahead index refresh
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Category)
+def suggestion_pre_save(sender, instance, raw=False, **kwargs):
+    instance._previous_suggestion = None
+    if instance.pk and not raw:
+        instance._previous_suggestion = (
+            sender.objects.filter(pk=instance.pk).values_list('name', 'is_active').first()
+        )
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def suggestions_saved(sender, instance, raw=False, **kwargs):
+    # Most saves (prices, descriptions...) leave the typeahead as it is, and
+    # each rebuild reads the whole catalog
+    if not raw and getattr(instance, '_previous_suggestion', None) != (instance.name, instance.is_active):
+        suggest.invalidate()
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def suggestions_deleted(sender, **kwargs):
+    suggest.invalidate()
+
+# Response cache invalidation
+
+def _category_and_ancestor_versions(*paths):
+    # Category listings include descendants, so every ancestor is affected
+    category_ids = {pk for path in paths for pk in Category.ids_from_path(path)}
+    return [category_version(category_id) for category_id in category_ids]
+
+def _bump_product(product_id, *category_ids):
+    if not category_ids:
+        category_ids = Product.objects.filter(pk=product_id).values_list('category_id', flat=True)
+    paths = Category.objects.filter(pk__in=category_ids).values_list('path', flat=True)
+    bump_versions(
+        PRODUCTS_VERSION, product_version(product_id),
+        *_category_and_ancestor_versions(*paths)
+    )
+
+def _bump_stock(product_ids, flipped_ids):
+    # Available counts are only in product details
+    versions = [product_version(product_id) for product_id in product_ids]
+    if flipped_ids:
+        paths = (
+            Category.objects.filter(products__pk__in=flipped_ids)
+            .order_by().values_list('path', flat=True).distinct()
+        )
+        versions += [PRODUCTS_VERSION, *_category_and_ancestor_versions(*paths)]
+    bump_versions(*versions)
+
+@receiver(pre_save, sender=Product)
+def product_pre_save(sender, instance, raw=False, **kwargs):
+    instance._previous_category_id = None
+    if instance.pk and not raw:
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=Product)
+def product_cache_saved(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_category_id', None)
+    category_ids = [instance.category_id] + ([previous] if previous else [])
+    _bump_product(instance.pk, *category_ids)
+
+@receiver(post_delete, sender=Product)
+def product_cache_deleted(sender, instance, **kwargs):
+    _bump_product(instance.pk, instance.category_id)
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def product_child_cache_changed(sender, instance, **kwargs):
+    _bump_product(instance.product_id)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_cache_changed(sender, instance, **kwargs):
+    # Sent before Category.save() writes the new path, so the ancestors it
+    # moves under are read from the parent's row, and those it leaves from
+    # the path saved before it
+    parent_path = Category.objects.filter(pk=instance.parent_id).values_list('path', flat=True).first() or ''
+    # Product payloads embed the category name
+    product_ids = Product.objects.filter(category_id=instance.pk).values_list('pk', flat=True)
+    bump_versions(
+        CATEGORIES_VERSION, PRODUCTS_VERSION, category_version(instance.pk),
+        *_category_and_ancestor_versions(parent_path, getattr(instance, '_previous_path', instance.path)),
+        *[product_version(product_id) for product_id in product_ids]
+    )
+
+@receiver(cart_changed)
+def cart_cache_changed(sender, user_id, **kwargs):
+    bump_versions(cart_version(user_id))
+
+# No post_delete receiver: it would turn every set-based delete of cart lines
+# into a fetch and a signal per line; those writers send cart_changed instead
+@receiver(post_save, sender=CartItem)
+def cart_item_cache_changed(sender, instance, **kwargs):
+    user_id = Cart.objects.filter(pk=instance.cart_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_versions(cart_version(user_id))
+
+@receiver(post_delete, sender=Cart)
+def cart_cache_deleted(sender, instance, **kwargs):
+    bump_versions(cart_version(instance.user_id))
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def coupon_cache_changed(sender, instance, **kwargs):
+    bump_versions(COUPONS_VERSION)
@@ -0,0 +1,157 @@
+import heapq
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .models import Category, Product
+from .search import TOKEN_RE
+
+VERSION_KEY = 'catalog:suggest:version'
+
+
+class SuggestionIndex:
+    """
+    Prefix index over active product and category names for typeahead.
+
+    Every word start of a name is a key ("iphone 15 pro", "15 pro", "pro"),
+    kept in one sorted list so a prefix is a bisect plus a short scan. The
+    top entries for every prefix up to `precomputed_length` characters are
+    stored outright, so the short, high-fanout prefixes typed first never
+    scan at all.
+
+    Catalog signals call invalidate() when a name is added, changed or
+    hidden, which bumps a version in the shared cache. Each process
+    rebuilds its copy the next time it is queried after the version
+    changes, and at least every `refresh_seconds` in case it missed the
+    change. With `background` the rebuild runs in a thread and requests
+    keep being answered from the previous copy until it is swapped in;
+    only a process's very first query waits for a build.
+    """
+
+    precomputed_length = 3
+
+    def __init__(self, limit=10, refresh_seconds=60, background=True):
+        self.limit = limit
+        self.refresh_seconds = refresh_seconds
+        self.background = background
+        self.state = ([], [], {})  # keys, entries, top; swapped as one
+        self.version = None  # None until first built
+        self.built_at = 0
+        self.lock = threading.Lock()
+
+    def build(self):
+        version = current_version()
+        products = Product.objects.filter(is_active=True).values_list('pk', 'name', 'review_count')
+        categories = Category.objects.filter(is_active=True).values_list('pk', 'name')
+
+        keyed = []
+        for kind, rows in (
+            ('product', ((pk, name, reviews) for pk, name, reviews in products.iterator(chunk_size=5000))),
+            ('category', ((pk, name, 0) for pk, name in categories)),
+        ):
+            for pk, name, popularity in rows:
+                entry = (kind, pk, name, popularity)
+                lowered = name.lower()
+                for match in TOKEN_RE.finditer(lowered):
+                    keyed.append((lowered[match.start():], entry))
+        keyed.sort(key=lambda item: item[0])
+
+        top = {}
+        for key, entry in keyed:
+            for length in range(1, min(len(key), self.precomputed_length) + 1):
+                top.setdefault((entry[0], key[:length]), {})[entry[1]] = entry
+        top = {
+            prefix: self._best(matches.values())
+            for prefix, matches in top.items()
+        }
+
+        keys = [key for key, _ in keyed]
+        entries = [entry for _, entry in keyed]
+        self.state = (keys, entries, top)
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def _best(self, entries):
+        return heapq.nsmallest(self.limit, entries, key=lambda e: (-e[3], e[2].lower(), e[1]))
+
+    def is_fresh(self):
+        return (
+            self.version is not None
+            and time.monotonic() - self.built_at < self.refresh_seconds
+            and current_version() == self.version
+        )
+
+    def ensure_fresh(self):
+        if self.is_fresh():
+            return
+        if self.version is None:
+            with self.lock:
+                if self.version is None:
+                    self.build()
+        elif self.lock.acquire(blocking=False):
+            if self.background:
+                threading.Thread(target=self._rebuild, name='suggestion-index', daemon=True).start()
+            else:
+                self._rebuild()
+
+    def _rebuild(self):
+        """build() under the lock taken by ensure_fresh(), releasing it after"""
+        try:
+            self.build()
+        finally:
+            self.lock.release()
+            if self.background:
+                # The thread's own connection would otherwise stay open
+                connections.close_all()
+
+    def suggest(self, prefix, kind, limit):
+        keys, entries, top = self.state
+        prefix = prefix.lower()
+        if len(prefix) <= self.precomputed_length:
+            return top.get((kind, prefix), [])[:limit]
+
+        matches = {}
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix):
+            entry = entries[position]
+            if entry[0] == kind:
+                matches[entry[1]] = entry
+            position += 1
+        return self._best(matches.values())[:limit]
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+suggestions = SuggestionIndex(
+    limit=getattr(settings, 'CATALOG_SUGGEST_LIMIT', 10),
+    refresh_seconds=getattr(settings, 'CATALOG_SUGGEST_REFRESH', 60),
+)
+
+
+def suggest(prefix, limit):
+    suggestions.ensure_fresh()
+    return {
+        'products': [
+            {'id': pk, 'name': name}
+            for _, pk, name, _ in suggestions.suggest(prefix, 'product', limit)
+        ],
+        'categories': [
+            {'id': pk, 'name': name}
+            for _, pk, name, _ in suggestions.suggest(prefix, 'category', limit)
+        ],
+    }
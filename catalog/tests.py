@@ -1,3 +1,1004 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import carts, inventory, rollups, suggest
+from .analytics import sales_timeseries
+from .cache import PRODUCTS_VERSION, category_version, get_versions, product_version
+from .checkout import place_order
+from .coupons import redeem
+from .importer import CatalogImport, read_rows
+from .models import (
+    PRODUCT_SORTS, Cart, CartItem, Category, Coupon, DailyProductSales, DailySales, InventoryHold,
+    InventoryShard, Order, OrderItem, Product, ProductImage, ProductReview, ProductSales, ProductVariant,
+)
+from .search import InvertedIndexSearchBackend
+from .serializers import CategorySerializer
+from .signals import stock_changed
+
+
+class ListingIndexUsageTests(TestCase):
+    """Every supported listing query should be answered from an index"""
+
+    product_count = 5000
+    category_count = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f'Category {i}') for i in range(cls.category_count)]
+        now = timezone.now()
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'Product {i:05d}',
+                description='Generated for index tests',
+                category=categories[i % cls.category_count],
+                base_price=Decimal(5 + (i * 37) % 995),
+                min_price=Decimal(5 + (i * 37) % 995),
+                max_price=Decimal(5 + (i * 37) % 995),
+                average_rating=Decimal((i % 50) / 10),
+                review_count=i % 13,
+                is_active=i % 10 != 0,
+                created_at=now - timedelta(minutes=i),
+            )
+            for i in range(cls.product_count)
+        )
+        ProductVariant.objects.bulk_create(
+            ProductVariant(
+                product=product,
+                name=f'Variant {n}',
+                sku=f'SKU-{product.pk}-{n}',
+                price_modifier=Decimal(n),
+                inventory_count=n % 3,
+                is_active=n != 2,
+            )
+            for product in products
+            for n in range(3)
+        )
+        cls.category = categories[0]
+        cls.product = products[1]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertIn('Index', plan)
+            self.assertNotIn('Seq Scan', plan)
+        else:
+            self.assertRegex(plan, r'USING (COVERING )?INDEX')
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_sorted_listings(self):
+        for sort in PRODUCT_SORTS:
+            if sort == 'relevance':
+                continue  # ordered by a computed search rank
+            with self.subTest(sort=sort):
+                self.assertUsesIndex(Product.objects.filter(is_active=True).sorted_by(sort)[:20])
+
+    def test_category_price_listing(self):
+        queryset = Product.objects.filter(category=self.category, is_active=True).priced_between(
+            max_price=500
+        ).order_by('min_price')[:20]
+        self.assertUsesIndex(queryset)
+
+    def test_active_variants(self):
+        self.assertUsesIndex(
+            ProductVariant.objects.filter(product=self.product, is_active=True).order_by('price_modifier')
+        )
+        self.assertUsesIndex(
+            ProductVariant.objects.filter(product=self.product, is_active=True, inventory_count__gt=0).order_by()
+        )
+
+
+class CatalogTestCase(TestCase):
+    """A product with two variants and a buyer with a cart"""
+
+    def setUp(self):
+        # The response and version cache outlives test transactions
+        cache.clear()
+        self.category = Category.objects.create(name='Category')
+        self.product = Product.objects.create(name='Product', category=self.category, base_price=Decimal('10'))
+        self.variant = ProductVariant.objects.create(
+            product=self.product, name='Small', sku='SKU-S', inventory_count=5
+        )
+        self.other = ProductVariant.objects.create(
+            product=self.product, name='Large', sku='SKU-L', price_modifier=Decimal('5'), inventory_count=3
+        )
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def assertStock(self, variant, inventory_count, reserved_count):
+        variant.refresh_from_db()
+        self.assertEqual((variant.inventory_count, variant.reserved_count), (inventory_count, reserved_count))
+
+    def create_coupon(self, **fields):
+        now = timezone.now()
+        return Coupon.objects.create(**{
+            'code': 'TENOFF', 'description': '10% off', 'discount_type': 'percentage',
+            'discount_value': Decimal('10'), 'valid_from': now - timedelta(days=1),
+            'valid_until': now + timedelta(days=1), **fields,
+        })
+
+
+class CheckoutTests(CatalogTestCase):
+    def test_takes_stock_and_consumes_holds(self):
+        carts.add_item(self.cart, self.variant.pk, 2)
+        carts.add_item(self.cart, self.other.pk, 1)
+        self.assertStock(self.variant, 5, 2)
+
+        order = place_order(self.user, shipping_address='Street', billing_address='Street')
+
+        self.assertEqual(order.total_amount, Decimal('35'))
+        self.assertEqual(
+            dict(order.items.values_list('variant_id', 'quantity')), {self.variant.pk: 2, self.other.pk: 1}
+        )
+        self.assertStock(self.variant, 3, 0)
+        self.assertStock(self.other, 2, 0)
+        self.assertFalse(InventoryHold.objects.filter(cart=self.cart).exists())
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+
+    def test_stock_changed_waits_for_the_commit(self):
+        sent = []
+
+        def receiver(sender, product_ids, **kwargs):
+            sent.append(set(product_ids))
+        stock_changed.connect(receiver)
+        self.addCleanup(stock_changed.disconnect, receiver)
+        carts.add_item(self.cart, self.variant.pk, 5)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            place_order(self.user, shipping_address='Street', billing_address='Street')
+            self.assertEqual(sent, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(sent, [{self.product.pk}])
+
+    def test_redeems_coupon(self):
+        coupon = self.create_coupon()
+        carts.add_item(self.cart, self.variant.pk, 2)
+
+        order = place_order(self.user, coupon_code='TENOFF', shipping_address='Street', billing_address='Street')
+
+        self.assertEqual((order.discount_amount, order.total_amount), (Decimal('2'), Decimal('18')))
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+
+    def test_insufficient_stock_changes_nothing(self):
+        coupon = self.create_coupon()
+        carts.add_item(self.cart, self.variant.pk, 2)
+        carts.add_item(self.cart, self.other.pk, 1)
+        # More than the 5 in stock, of which the cart holds 2
+        CartItem.objects.filter(cart=self.cart, variant=self.variant).update(quantity=6)
+
+        with self.assertRaises(ValidationError):
+            place_order(self.user, coupon_code='TENOFF', shipping_address='Street', billing_address='Street')
+
+        self.assertFalse(Order.objects.exists())
+        self.assertStock(self.variant, 5, 2)
+        self.assertStock(self.other, 3, 1)
+        self.assertEqual(InventoryHold.objects.filter(cart=self.cart).count(), 2)
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 0)
+
+
+class QuoteTests(CatalogTestCase):
+    def test_quote_without_writes(self):
+        self.create_coupon()
+        carts.add_item(self.cart, self.variant.pk, 2)
+        carts.add_item(self.cart, self.other.pk, 1)
+        # Another buyer holds the rest of the Large
+        carts.add_item(Cart.objects.create(user=User.objects.create_user('other')), self.other.pk, 2)
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            quote = self.client.get('/api/checkout/quote/', {'coupon_code': 'TENOFF'}).json()
+        self.assertEqual([query['sql'].split()[0] for query in queries if not query['sql'].startswith('SELECT')], [])
+
+        self.assertEqual(
+            [(line['variant_sku'], line['quantity'], line['available'], line['in_stock']) for line in quote['lines']],
+            [('SKU-L', 1, 1, True), ('SKU-S', 2, 5, True)],
+        )
+        self.assertEqual(
+            (quote['subtotal'], quote['coupon'], quote['discount_amount'], quote['total']), (35, 'TENOFF', 3.5, 31.5)
+        )
+        self.assertEqual(quote['best_coupon'], {'code': 'TENOFF', 'discount_amount': 3.5})
+        self.assertTrue(quote['can_checkout'])
+
+    def test_anonymous_quote(self):
+        carts.add_item(self.cart, self.other.pk, 3)
+        self.client.cookies['catalog_cart'] = carts.DraftCart({self.other.pk: 1}).to_cookie()
+
+        quote = self.client.get('/api/checkout/quote/', {'coupon_code': 'NOPE'}).json()
+        self.assertEqual([(line['available'], line['in_stock']) for line in quote['lines']], [(0, False)])
+        self.assertEqual((quote['coupon'], quote['discount_amount']), (None, 0))
+        self.assertIsNotNone(quote['coupon_error'])
+        self.assertFalse(quote['can_checkout'])
+
+
+class InventoryHoldTests(CatalogTestCase):
+    def test_reserve_and_release(self):
+        self.assertTrue(inventory.reserve(self.cart, self.variant.pk, 3))
+        self.assertStock(self.variant, 5, 3)
+        # Replaces the hold, so 3 + 3 is never counted
+        self.assertFalse(inventory.reserve(self.cart, self.variant.pk, 6))
+        self.assertTrue(inventory.reserve(self.cart, self.variant.pk, 5))
+        self.assertStock(self.variant, 5, 5)
+
+        self.assertEqual(inventory.release(self.cart), {self.variant.pk: 5})
+        self.assertStock(self.variant, 5, 0)
+        self.assertFalse(InventoryHold.objects.exists())
+
+    def test_inactive_variant_is_not_held(self):
+        ProductVariant.objects.filter(pk=self.other.pk).update(is_active=False)
+        self.assertEqual(
+            inventory.reserve_many(self.cart, {self.variant.pk: 1, self.other.pk: 1}), [self.other.pk]
+        )
+        self.assertStock(self.variant, 5, 0)
+
+    def test_release_expired(self):
+        inventory.reserve(self.cart, self.variant.pk, 2)
+        self.assertEqual(list(inventory.release_expired(now=timezone.now())), [])
+
+        later = timezone.now() + inventory.hold_ttl() + timedelta(seconds=1)
+        self.assertEqual(list(inventory.release_expired(now=later)), [1])
+        self.assertStock(self.variant, 5, 0)
+        self.assertFalse(InventoryHold.objects.exists())
+
+    def test_hold_changes_send_stock_changed(self):
+        sent = []
+
+        def receiver(sender, product_ids, **kwargs):
+            sent.append(set(product_ids))
+        stock_changed.connect(receiver)
+        self.addCleanup(stock_changed.disconnect, receiver)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.reserve(self.cart, self.variant.pk, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.release(self.cart)
+        self.assertEqual(sent, [{self.product.pk}, {self.product.pk}])
+
+    def test_holds_only_invalidate_the_product(self):
+        names = [PRODUCTS_VERSION, product_version(self.product.pk), category_version(self.category.pk)]
+        before = get_versions(names)
+        updated_at = Product.objects.get(pk=self.product.pk).updated_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.reserve(self.cart, self.variant.pk, 5)
+        after = get_versions(names)
+        self.assertEqual(after[PRODUCTS_VERSION], before[PRODUCTS_VERSION])
+        self.assertEqual(after[category_version(self.category.pk)], before[category_version(self.category.pk)])
+        self.assertNotEqual(after[product_version(self.product.pk)], before[product_version(self.product.pk)])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).updated_at, updated_at)
+
+    def test_selling_out_refreshes_listings(self):
+        before = get_versions([PRODUCTS_VERSION])
+        ProductVariant.objects.filter(pk=self.variant.pk).update(inventory_count=0)
+        ProductVariant.objects.filter(pk=self.other.pk).update(inventory_count=0)
+        stock_changed.send(sender=ProductVariant, product_ids={self.product.pk})
+        self.assertFalse(Product.objects.get(pk=self.product.pk).in_stock)
+        self.assertNotEqual(get_versions([PRODUCTS_VERSION]), before)
+
+
+class ShardedStockTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        ProductVariant.objects.filter(pk=self.variant.pk).update(inventory_count=10)
+        inventory.enable_sharding(self.variant, 4)
+        self.variant.refresh_from_db()
+
+    def shard_counts(self):
+        return list(
+            InventoryShard.objects.filter(variant=self.variant).order_by('shard').values_list('count', flat=True)
+        )
+
+    def test_enable_moves_stock_into_shards(self):
+        self.assertEqual(self.shard_counts(), [3, 3, 2, 2])
+        self.assertEqual((self.variant.stock_shards, self.variant.inventory_count), (4, 0))
+        self.assertEqual(self.variant.available_count, 10)
+
+    def test_set_stock(self):
+        inventory.set_stock(self.variant, 7)
+        self.assertEqual(self.shard_counts(), [2, 2, 2, 1])
+
+    def test_decrement_across_shards(self):
+        # No single shard has 7, so the shards are locked and evened out
+        self.assertTrue(inventory.decrement_stock({self.variant.pk: 7}))
+        self.assertEqual(sum(self.shard_counts()), 3)
+        self.assertFalse(inventory.decrement_stock({self.variant.pk: 4}))
+        self.assertEqual(sum(self.shard_counts()), 3)
+
+    def test_holds_come_out_of_shards(self):
+        self.assertTrue(inventory.reserve(self.cart, self.variant.pk, 4))
+        self.assertEqual(sum(self.shard_counts()), 6)
+        inventory.release(self.cart)
+        self.assertEqual(sum(self.shard_counts()), 10)
+
+    def test_cart_stock_takes_one_query(self):
+        large = ProductVariant.objects.create(product=self.product, name='X-Large', sku='SKU-XL', inventory_count=6)
+        inventory.enable_sharding(large, 2)
+        self.client.force_login(self.user)
+
+        def cart_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get('/customer/cart/').status_code, 200)
+                self.assertEqual(self.client.get('/api/cart/').status_code, 200)
+            return len(queries)
+
+        carts.add_item(self.cart, self.variant.pk, 1)
+        one_line = cart_queries()
+        carts.add_item(self.cart, large.pk, 1)
+        self.assertEqual(cart_queries(), one_line)
+
+    def test_disable_folds_holds_back(self):
+        inventory.reserve(self.cart, self.variant.pk, 4)
+        inventory.disable_sharding(self.variant)
+        self.assertStock(self.variant, 10, 4)
+        self.assertFalse(InventoryShard.objects.filter(variant=self.variant).exists())
+
+
+class CartOperationTests(CatalogTestCase):
+    def lines(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list('variant_id', 'quantity'))
+
+    def holds(self):
+        return dict(InventoryHold.objects.filter(cart=self.cart).values_list('variant_id', 'quantity'))
+
+    def test_operations_fold_into_one_change_per_line(self):
+        carts.apply_operations(self.cart, [
+            (carts.ADD, self.variant.pk, 2), (carts.ADD, self.variant.pk, 1), (carts.SET, self.other.pk, 2),
+        ])
+        self.assertEqual(self.lines(), {self.variant.pk: 3, self.other.pk: 2})
+        self.assertEqual(self.holds(), self.lines())
+
+        carts.apply_operations(self.cart, [(carts.REMOVE, self.other.pk, 0), (carts.SET, self.variant.pk, 1)])
+        self.assertEqual(self.lines(), {self.variant.pk: 1})
+        self.assertEqual(self.holds(), {self.variant.pk: 1})
+        self.assertStock(self.variant, 5, 1)
+        self.assertStock(self.other, 3, 0)
+
+    def test_unavailable_line_changes_nothing(self):
+        carts.add_item(self.cart, self.variant.pk, 1)
+        with self.assertRaises(carts.Unavailable) as raised:
+            carts.apply_operations(self.cart, [(carts.ADD, self.variant.pk, 1), (carts.SET, self.other.pk, 4)])
+        self.assertEqual(raised.exception.variant_ids, [self.other.pk])
+        self.assertEqual(self.lines(), {self.variant.pk: 1})
+        self.assertStock(self.variant, 5, 1)
+
+    def test_anonymous_cart_merged_on_login(self):
+        carts.add_item(self.cart, self.variant.pk, 1)
+        draft = carts.DraftCart({self.variant.pk: 2, self.other.pk: 1})
+        self.client.cookies['catalog_cart'] = draft.to_cookie()
+        # Sold out since it was put in the anonymous cart
+        ProductVariant.objects.filter(pk=self.other.pk).update(inventory_count=0)
+
+        self.client.force_login(self.user)
+        response = self.client.get('/api/cart/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies['catalog_cart'].value, '')
+        self.assertEqual(self.lines(), {self.variant.pk: 3})
+        self.assertEqual(self.holds(), {self.variant.pk: 3})
+
+
+class CartSummaryTests(CatalogTestCase):
+    def summary(self):
+        response = self.client.get('/api/cart/summary/')
+        return response['X-Cache'], response.json()
+
+    def test_cached_until_the_cart_or_a_product_changes(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.add_item(self.cart, self.variant.pk, 2)
+        self.assertEqual(self.summary(), ('MISS', {'total_items': 2, 'total_price': 20.0}))
+        self.assertEqual(self.summary(), ('HIT', {'total_items': 2, 'total_price': 20.0}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.add_item(self.cart, self.other.pk, 1)
+        self.assertEqual(self.summary(), ('MISS', {'total_items': 3, 'total_price': 35.0}))
+
+        self.product.base_price = Decimal('20')
+        self.product.save()
+        self.assertEqual(self.summary(), ('MISS', {'total_items': 3, 'total_price': 65.0}))
+
+    def test_anonymous_cart(self):
+        self.client.cookies['catalog_cart'] = carts.DraftCart({self.other.pk: 2}).to_cookie()
+        response = self.client.get('/api/cart/summary/')
+        self.assertEqual(response.json(), {'total_items': 2, 'total_price': 30.0})
+
+
+class CouponRedeemTests(CatalogTestCase):
+    def test_redeem_stops_at_max_uses(self):
+        coupon = self.create_coupon(max_uses=2)
+        self.assertEqual([redeem(coupon) for _ in range(3)], [True, True, False])
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 2)
+
+    def test_expired_coupon_is_not_redeemed(self):
+        coupon = self.create_coupon(valid_until=timezone.now() - timedelta(minutes=1))
+        self.assertFalse(redeem(coupon))
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(name='Root')
+        self.child = Category.objects.create(name='Child', parent=self.root)
+        self.grandchild = Category.objects.create(name='Grandchild', parent=self.child)
+        self.other_root = Category.objects.create(name='Other root')
+
+    def test_moving_a_category_rewrites_its_subtree(self):
+        product = Product.objects.create(name='Product', category=self.grandchild, base_price=Decimal('1'))
+        self.child.parent = self.other_root
+        self.child.save()
+
+        self.grandchild.refresh_from_db()
+        self.assertEqual(
+            Category.ids_from_path(self.grandchild.path), [self.other_root.pk, self.child.pk, self.grandchild.pk]
+        )
+        self.assertEqual(self.grandchild.depth, 2)
+        self.assertEqual(list(Product.objects.in_category(self.other_root.pk)), [product])
+        self.assertFalse(Product.objects.in_category(self.root.pk).exists())
+
+    def test_saving_a_stale_instance_keeps_the_moved_path(self):
+        stale = Category.objects.get(pk=self.grandchild.pk)
+        self.child.parent = self.other_root
+        self.child.save()
+
+        stale.description = 'Edited'
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual(
+            Category.ids_from_path(stale.path), [self.other_root.pk, self.child.pk, self.grandchild.pk]
+        )
+        self.assertEqual(list(self.other_root.get_descendants()), [self.child, self.grandchild, self.other_root])
+
+    def test_moving_a_category_refreshes_both_ancestor_listings(self):
+        Product.objects.create(name='Product', category=self.grandchild, base_price=Decimal('1'))
+        for category, count in ((self.root, 1), (self.other_root, 0)):
+            response = self.client.get(f'/api/categories/{category.pk}/products/')
+            self.assertEqual(response.json()['count'], count)
+
+        self.child.parent = self.other_root
+        self.child.save()
+
+        for category, count in ((self.root, 0), (self.other_root, 1)):
+            with self.subTest(category=category.name):
+                response = self.client.get(f'/api/categories/{category.pk}/products/')
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertEqual(response.json()['count'], count)
+
+    def test_parent_cannot_be_a_descendant(self):
+        for parent in (self.root, self.grandchild):
+            with self.subTest(parent=parent.name):
+                serializer = CategorySerializer(self.root, data={'parent': parent.pk}, partial=True)
+                self.assertFalse(serializer.is_valid())
+                self.assertIn('parent', serializer.errors)
+
+    def test_parent_depth_is_limited(self):
+        parent = self.grandchild
+        while parent.depth < Category.max_depth():
+            parent = Category.objects.create(name=f'Level {parent.depth + 1}', parent=parent)
+        serializer = CategorySerializer(data={'name': 'Too deep', 'parent': parent.pk})
+        self.assertFalse(serializer.is_valid())
+        # The child moves its own child along
+        serializer = CategorySerializer(self.child, data={'parent': parent.parent_id}, partial=True)
+        self.assertFalse(serializer.is_valid())
+
+
+class ProductSummaryTests(CatalogTestCase):
+    def test_price_and_stock_summary(self):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.min_price, self.product.max_price), (Decimal('10'), Decimal('15')))
+        self.assertTrue(self.product.in_stock)
+
+        ProductVariant.objects.filter(pk=self.variant.pk).update(inventory_count=0)
+        ProductVariant.objects.filter(pk=self.other.pk).update(is_active=False)
+        Product.objects.filter(pk=self.product.pk).refresh_price_summary()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.min_price, self.product.max_price), (Decimal('10'), Decimal('10')))
+        self.assertFalse(self.product.in_stock)
+
+    def test_rating_summary_follows_reviews(self):
+        other_user = User.objects.create_user('reviewer')
+        review = ProductReview.objects.create(
+            product=self.product, user=self.user, rating=5, title='Great', comment='Great'
+        )
+        ProductReview.objects.create(product=self.product, user=other_user, rating=2, title='Meh', comment='Meh')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.review_count, self.product.average_rating), (2, Decimal('3.50')))
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+
+        review.rating = 4
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 1, 5: 0})
+        self.assertEqual(self.product.average_rating, Decimal('3.00'))
+
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.review_count, self.product.rating_sum), (1, 2))
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0})
+
+        # The incremental updates agree with a full recount
+        Product.objects.filter(pk=self.product.pk).refresh_rating_summary()
+        recounted = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(recounted.rating_histogram, self.product.rating_histogram)
+        self.assertEqual(recounted.average_rating, self.product.average_rating)
+
+
+class ReviewPageTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        for i, votes in enumerate([3, 0, 5, 3, 1]):
+            ProductReview.objects.create(
+                product=self.product, user=User.objects.create_user(f'reviewer{i}'),
+                rating=i + 1, title=f'Review {i}', comment='', helpful_votes=votes,
+            )
+        self.client.force_login(self.user)
+
+    def walk(self, sort):
+        url = f'/api/products/{self.product.pk}/reviews/?sort={sort}&page_size=2'
+        titles = []
+        while url:
+            with self.assertNumQueries(3):  # session, user, then the page with its reviewers
+                page = self.client.get(url).json()
+            titles += [review['title'] for review in page['results']]
+            url = page['next']
+        return titles
+
+    def test_review_pages(self):
+        recent = list(
+            ProductReview.objects.order_by('-created_at', '-id').values_list('title', flat=True)
+        )
+        self.assertEqual(self.walk('recent'), recent)
+        helpful = list(
+            ProductReview.objects.order_by('-helpful_votes', '-created_at', '-id').values_list('title', flat=True)
+        )
+        self.assertEqual(self.walk('helpful'), helpful)
+
+    def test_detail_shows_recent_reviews_and_summary(self):
+        with self.settings(CATALOG_DETAIL_REVIEW_COUNT=2):
+            product = self.client.get(f'/api/products/{self.product.pk}/').json()
+        self.assertEqual([review['title'] for review in product['reviews']], ['Review 4', 'Review 3'])
+        self.assertEqual((product['total_reviews'], product['average_rating']), (5, 3.0))
+        self.assertEqual(product['rating_histogram'], {str(rating): 1 for rating in range(1, 6)})
+
+
+class SalesRollupTests(CatalogTestCase):
+    def create_order(self, discount, **lines):
+        items = [(getattr(self, name), quantity) for name, quantity in lines.items()]
+        subtotal = sum(variant.final_price * quantity for variant, quantity in items)
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD-{Order.objects.count()}', total_amount=subtotal - discount,
+            discount_amount=discount, shipping_address='Street', billing_address='Street',
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, variant=variant, quantity=quantity, price=variant.final_price)
+            for variant, quantity in items
+        )
+        return order
+
+    def timeseries(self, **kwargs):
+        now = timezone.now()
+        return sales_timeseries('day', now - timedelta(days=1), now + timedelta(days=1), **kwargs)
+
+    def test_net_line_revenue_adds_up_to_the_total(self):
+        lines = [
+            {'order': 1, 'price': Decimal('10'), 'quantity': 1, 'order__total_amount': Decimal('10')},
+            {'order': 1, 'price': Decimal('10'), 'quantity': 1, 'order__total_amount': Decimal('10')},
+            {'order': 1, 'price': Decimal('10'), 'quantity': 1, 'order__total_amount': Decimal('10')},
+            {'order': 2, 'price': Decimal('10'), 'quantity': 1, 'order__total_amount': Decimal('27')},
+            {'order': 2, 'price': Decimal('20'), 'quantity': 1, 'order__total_amount': Decimal('27')},
+        ]
+        self.assertEqual(
+            [revenue for _, revenue in rollups.net_line_revenue(lines)],
+            [Decimal('3.33'), Decimal('3.34'), Decimal('3.33'), Decimal('9'), Decimal('18')],
+        )
+
+    def test_roll_up_counts_each_order_once(self):
+        self.create_order(Decimal('0'), variant=2)
+        self.create_order(Decimal('3.50'), variant=1, other=1)
+
+        self.assertEqual(sum(rollups.roll_up()), 2)
+        self.assertEqual(sum(rollups.roll_up()), 0)
+
+        day = DailySales.objects.get()
+        self.assertEqual((day.order_count, day.units, day.revenue), (2, 4, Decimal('41.50')))
+        self.assertEqual(
+            sum(DailyProductSales.objects.values_list('revenue', flat=True)), Decimal('41.50')
+        )
+        lifetime = ProductSales.objects.get(product=self.product)
+        self.assertEqual((lifetime.order_count, lifetime.units, lifetime.revenue), (2, 4, Decimal('41.50')))
+
+    def test_rebuild(self):
+        self.create_order(Decimal('1'), variant=1)
+        list(rollups.roll_up())
+        rollups.rebuild()
+        self.assertFalse(DailySales.objects.exists())
+        self.assertEqual(sum(rollups.roll_up()), 1)
+        self.assertEqual(DailySales.objects.get().revenue, Decimal('9'))
+
+    def test_timeseries_breakdowns_match_totals(self):
+        self.create_order(Decimal('3.50'), variant=1, other=1)
+        list(rollups.roll_up())
+        # Pending, not rolled up yet
+        self.create_order(Decimal('2'), variant=2)
+
+        totals = self.timeseries()['series'][0]['totals']
+        self.assertEqual(totals, {'order_count': 2, 'units': 4, 'revenue': 39.5})
+        for group in ('product', 'category'):
+            with self.subTest(group=group):
+                series = self.timeseries(group=group)['series']
+                self.assertEqual([s['totals']['revenue'] for s in series], [39.5])
+        self.assertEqual(self.timeseries(category=self.category.pk)['series'][0]['totals'], totals)
+
+
+class ProductListTests(CatalogTestCase):
+    def add_products(self, count):
+        start = Product.objects.count()
+        for i in range(start, start + count):
+            product = Product.objects.create(
+                name=f'Listed {i}', category=self.category, base_price=Decimal('20') + i
+            )
+            ProductVariant.objects.create(product=product, name='One', sku=f'SKU-{i}', inventory_count=1)
+            ProductImage.objects.create(product=product, image=f'product_images/{i}.jpg', is_primary=True)
+
+    def count_queries(self, url):
+        # Past the response cache
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_listing_queries_do_not_grow_with_products(self):
+        urls = ['/api/products/', '/api/products/search/?q=listed',
+                f'/api/categories/{self.category.pk}/products/']
+        self.add_products(1)
+        expected = [self.count_queries(url) for url in urls]
+        self.add_products(5)
+        self.assertEqual([self.count_queries(url) for url in urls], expected)
+
+        listed = self.client.get('/api/products/search/?q=listed&sort=min_price').json()[0]
+        self.assertEqual((listed['min_price'], listed['max_price']), (21, 21))
+        self.assertTrue(listed['primary_image']['image'].endswith('product_images/1.jpg'))
+
+    def walk(self, url):
+        names = []
+        while url:
+            page = self.client.get(url).json()
+            names += [product['name'] for product in page['results']]
+            url = page['next']
+        return names
+
+    def test_cursor_pages(self):
+        self.add_products(4)
+        # Equal prices page by id
+        Product.objects.filter(name='Listed 3').update(base_price=Decimal('21'))
+        Product.objects.refresh_price_summary()
+
+        newest_first = list(Product.objects.order_by('-created_at', '-id').values_list('name', flat=True))
+        self.assertEqual(self.walk('/api/products/?pagination=cursor&page_size=2'), newest_first)
+        self.assertEqual(
+            self.walk('/api/products/search/?q=listed&sort=min_price&pagination=cursor&page_size=2'),
+            ['Listed 1', 'Listed 3', 'Listed 2', 'Listed 4'],
+        )
+        self.assertEqual(self.client.get('/api/products/?cursor=bogus').status_code, 404)
+
+
+class ResponseCacheTests(CatalogTestCase):
+    def test_hit_without_queries(self):
+        url = '/api/products/?ordering=name&search=product'
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # Parameter order and empty parameters don't change the key
+        with self.assertNumQueries(0):
+            hit = self.client.get('/api/products/?search=product&category=&ordering=name')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit.json(), response.json())
+
+    def test_writes_invalidate_only_their_product(self):
+        other = Product.objects.create(name='Other', category=self.category, base_price=Decimal('20'))
+        urls = ['/api/products/', f'/api/products/{self.product.pk}/', f'/api/products/{other.pk}/']
+        for url in urls:
+            self.client.get(url)
+
+        other.name = 'Renamed'
+        other.save()
+
+        listing, unchanged, changed = (self.client.get(url) for url in urls)
+        self.assertEqual(
+            [response['X-Cache'] for response in (listing, unchanged, changed)], ['MISS', 'HIT', 'MISS']
+        )
+        self.assertEqual(changed.json()['name'], 'Renamed')
+        self.assertIn('Renamed', [product['name'] for product in listing.json()['results']])
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def test_not_modified_without_queries(self):
+        for url in ('/api/products/', f'/api/products/{self.product.pk}/',
+                    f'/api/categories/{self.category.pk}/products/', '/api/categories/tree/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_write_changes_the_etag(self):
+        url = f'/api/products/{self.product.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.product.name = 'Renamed'
+        self.product.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['name'], 'Renamed')
+
+
+class SearchViewTests(CatalogTestCase):
+    def search(self, **params):
+        return self.client.get('/api/products/search/', params)
+
+    def test_rating_filter(self):
+        rated = Product.objects.create(name='Rated', category=self.category, base_price=Decimal('20'))
+        ProductReview.objects.create(product=rated, user=self.user, rating=4, title='Good', comment='Good')
+
+        response = self.search(rating='3.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()], ['Rated'])
+        self.assertEqual(len(self.search(rating='0').json()), 2)
+
+        for rating in ('nan', 'inf', '-infinity', '6', '-1', 'four'):
+            with self.subTest(rating=rating):
+                self.assertEqual(self.search(rating=rating).status_code, 400)
+
+    def test_facets_match_the_filters(self):
+        for name, price, stock in (('Cheap', '12', 1), ('Mid', '25', 1), ('Dear', '38', 0)):
+            product = Product.objects.create(name=name, category=self.category, base_price=Decimal(price))
+            ProductVariant.objects.create(product=product, name='One', sku=f'SKU-{name}', inventory_count=stock)
+
+        facets = self.search(facets='1', price_bucket='10').json()['facets']
+        self.assertEqual([(bucket['min'], bucket['count']) for bucket in facets['price']], [(10, 2), (20, 1), (30, 1)])
+        self.assertEqual(facets['stock'], {'in_stock': 3, 'out_of_stock': 1})
+        self.assertEqual(facets['categories'], [{'id': self.category.pk, 'name': 'Category', 'count': 4}])
+        # Selecting a bucket lists what it counted
+        for bucket in facets['price']:
+            listed = self.search(min_price=bucket['min'], max_price=bucket['max'] - 0.01).json()
+            self.assertEqual(len(listed), bucket['count'])
+
+        paged = self.search(q='cheap', facets='1', pagination='cursor').json()
+        self.assertEqual([product['name'] for product in paged['results']], ['Cheap'])
+        self.assertEqual(paged['facets']['stock'], {'in_stock': 1, 'out_of_stock': 0})
+
+
+class SuggestTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        # Rebuilt from this test's rows, in the test's thread
+        suggest.suggestions.version = None
+        patcher = mock.patch.object(suggest.suggestions, 'background', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, suggest.suggestions, 'version', None)
+
+    def names(self, prefix):
+        response = self.client.get('/api/products/suggest/', {'q': prefix})
+        self.assertEqual(response.status_code, 200)
+        return {kind: [match['name'] for match in matches] for kind, matches in response.json().items()}
+
+    def test_word_prefixes(self):
+        Product.objects.create(name='Phone Case', category=self.category, base_price=Decimal('5'))
+        self.assertEqual(self.names('ca'), {'products': ['Phone Case'], 'categories': ['Category']})
+        self.assertEqual(self.names('phone c'), {'products': ['Phone Case'], 'categories': []})
+        self.assertEqual(self.names('zz'), {'products': [], 'categories': []})
+
+    def test_only_name_changes_invalidate(self):
+        self.assertEqual(self.names('prod')['products'], ['Product'])
+        version = suggest.current_version()
+
+        self.product.base_price = Decimal('12')
+        self.product.save()
+        self.assertEqual(suggest.current_version(), version)
+
+        self.product.name = 'Gadget'
+        self.product.save()
+        self.assertNotEqual(suggest.current_version(), version)
+        self.assertEqual(self.names('prod')['products'], [])
+        self.assertEqual(self.names('gad')['products'], ['Gadget'])
+
+    def test_stale_index_is_served_while_rebuilding(self):
+        self.assertEqual(self.names('prod')['products'], ['Product'])
+        started, finish = threading.Event(), threading.Event()
+
+        def slow_build():
+            started.set()
+            finish.wait(5)
+
+        with mock.patch.object(suggest.suggestions, 'background', True), \
+                mock.patch.object(suggest.suggestions, 'build', slow_build), \
+                mock.patch.object(suggest, 'connections'):
+            suggest.invalidate()
+            self.assertEqual(self.names('prod')['products'], ['Product'])
+            self.assertTrue(started.wait(5))
+            # Still answered from the previous index
+            self.assertEqual(self.names('prod')['products'], ['Product'])
+            finish.set()
+            self.assertTrue(suggest.suggestions.lock.acquire(timeout=5))
+            suggest.suggestions.lock.release()
+
+
+class InvertedIndexSyncTests(CatalogTestCase):
+    def names(self, backend, query):
+        return list(backend.search(Product.objects.all(), query).values_list('name', flat=True))
+
+    def rename_elsewhere(self, name):
+        # As another worker would: this process's index hears nothing
+        Product.objects.filter(pk=self.product.pk).update(name=name, updated_at=timezone.now())
+
+    def test_catches_up_with_other_processes(self):
+        backend = InvertedIndexSearchBackend(background=False)
+        self.assertEqual(self.names(backend, 'product'), ['Product'])
+
+        self.rename_elsewhere('Zebra')
+        self.assertEqual(self.names(backend, 'zebra'), [])
+        # Their write bumps the shared version
+        backend._changed()
+        self.assertEqual(self.names(backend, 'zebra'), ['Zebra'])
+        self.assertEqual(self.names(backend, 'product'), [])
+
+    def test_snapshot_catches_up_on_load(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(CATALOG_SEARCH_INDEX_PATH=os.path.join(directory, 'search.idx')):
+            InvertedIndexSearchBackend().rebuild()
+            self.rename_elsewhere('Zebra')
+
+            self.assertEqual(self.names(InvertedIndexSearchBackend(background=False), 'zebra'), ['Zebra'])
+
+
+class CatalogImportTests(TestCase):
+    FEED = (
+        'sku,name,category,base_price,variant_sku,variant_name,price_modifier,inventory_count\n'
+        'TEE,T-shirt,Clothing > Shirts,20,TEE-S,Small,0,5\n'
+        'TEE,T-shirt,Clothing > Shirts,20,TEE-L,Large,2,3\n'
+        'MUG,Mug,Kitchen,8,,,,\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+
+    def run_import(self, feed, **kwargs):
+        totals = {}
+        for counts in CatalogImport(**kwargs).run(read_rows(io.StringIO(feed), 'csv')):
+            for key, count in counts.items():
+                # Counts, and the list of (line, message) errors
+                totals[key] = totals[key] + count if key in totals else count
+        return totals
+
+    def test_creates_then_updates_by_sku(self):
+        counts = self.run_import(self.FEED)
+        self.assertEqual(
+            [counts[key] for key in ('products_created', 'variants_created', 'categories_created')], [2, 2, 3]
+        )
+        shirts = Category.objects.get(name='Shirts')
+        self.assertEqual(shirts.parent.name, 'Clothing')
+        tee = Product.objects.get(sku='TEE')
+        self.assertEqual((tee.category, tee.min_price, tee.max_price), (shirts, Decimal('20'), Decimal('22')))
+
+        counts = self.run_import(self.FEED.replace('Large,2,3', 'Large,4,0'), batch_size=1)
+        self.assertEqual((counts['products_created'], counts['variants_updated']), (0, 2))
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Category.objects.count(), 3)
+        large = ProductVariant.objects.get(sku='TEE-L')
+        self.assertEqual((large.price_modifier, large.inventory_count), (Decimal('4'), 0))
+
+    def test_bad_rows_are_skipped(self):
+        counts = self.run_import(self.FEED + 'BAD,Bad,Kitchen,free,,,,\n')
+        self.assertEqual(counts['errors'], [(5, "base_price is not a number: 'free'")])
+        self.assertFalse(Product.objects.filter(sku='BAD').exists())
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_dry_run_writes_nothing(self):
+        counts = self.run_import(self.FEED, dry_run=True)
+        self.assertEqual(counts['products_created'], 2)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(Category.objects.exists())
+
+
+class ConcurrencyTestCase(TransactionTestCase):
+    thread_count = 16
+
+    def run_in_threads(self, target, times=1):
+        errors = []
+        start = threading.Barrier(self.thread_count)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(times):
+                    target()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs a database with concurrent writers')
+class ConcurrentCartTests(ConcurrencyTestCase):
+    """Parallel adds to a cart line must all count, without retries"""
+
+    adds_per_thread = 5
+
+    def setUp(self):
+        category = Category.objects.create(name='Category')
+        product = Product.objects.create(name='Product', category=category, base_price=Decimal('10'))
+        self.variant = ProductVariant.objects.create(
+            product=product, name='Variant', sku='SKU-1', inventory_count=1000
+        )
+        self.cart = Cart.objects.create(user=User.objects.create_user('buyer'))
+
+    def test_parallel_adds_to_one_line(self):
+        self.run_in_threads(lambda: carts.add_item(self.cart, self.variant.pk, 1), self.adds_per_thread)
+
+        total = self.thread_count * self.adds_per_thread
+        self.assertEqual(CartItem.objects.get(cart=self.cart, variant=self.variant).quantity, total)
+        self.assertEqual(InventoryHold.objects.get(cart=self.cart, variant=self.variant).quantity, total)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.reserved_count, total)
+
+    def test_parallel_adds_never_oversell(self):
+        ProductVariant.objects.filter(pk=self.variant.pk).update(inventory_count=7)
+        successes = []
+
+        def add():
+            try:
+                carts.add_item(self.cart, self.variant.pk, 1)
+            except ValidationError:
+                return
+            successes.append(1)
+
+        self.run_in_threads(add, self.adds_per_thread)
+
+        self.assertEqual(len(successes), 7)
+        self.assertEqual(CartItem.objects.get(cart=self.cart, variant=self.variant).quantity, 7)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.reserved_count, 7)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs a database with concurrent writers')
+class ConcurrentCouponTests(ConcurrencyTestCase):
+    """Racing checkouts must never redeem a coupon past max_uses"""
+
+    def test_parallel_redeems_stop_at_max_uses(self):
+        now = timezone.now()
+        coupon = Coupon.objects.create(
+            code='RACE', description='Race', discount_type='fixed', discount_value=Decimal('1'), max_uses=5,
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+        redeemed = []
+        self.run_in_threads(lambda: redeemed.append(redeem(coupon)), times=2)
+
+        self.assertEqual(redeemed.count(True), 5)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 5)
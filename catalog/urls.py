@@ -7,6 +7,7 @@ urlpatterns = [
     
     # Categories
     path('categories/', views.CategoryListCreateView.as_view(), name='category-list'),
+    path('categories/tree/', views.CategoryTreeView.as_view(), name='category-tree'),
     path('categories/<int:pk>/', views.CategoryDetailView.as_view(), name='category-detail'),
     path('categories/<int:category_id>/products/', views.category_products, name='category-products'),
     
@@ -14,6 +15,7 @@ urlpatterns = [
     path('products/', views.ProductListCreateView.as_view(), name='product-list'),
     path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
     path('products/search/', views.search_products, name='search-products'),
+    path('products/suggest/', views.suggest_products, name='suggest-products'),
     
     # Product Variants
     path('variants/', views.ProductVariantListCreateView.as_view(), name='variant-list'),
@@ -22,6 +24,8 @@ urlpatterns = [
     # Cart
     path('cart/', views.CartView.as_view(), name='cart'),
     path('cart/add/', views.add_to_cart, name='add-to-cart'),
+    path('cart/batch/', views.cart_batch, name='cart-batch'),
+    path('cart/summary/', views.cart_summary, name='cart-summary'),
     path('cart/items/<int:item_id>/', views.update_cart_item, name='update-cart-item'),
     path('cart/items/<int:item_id>/remove/', views.remove_from_cart, name='remove-from-cart'),
     
@@ -35,6 +39,7 @@ urlpatterns = [
     # Orders
     path('orders/', views.OrderListCreateView.as_view(), name='order-list'),
     path('orders/<int:pk>/', views.OrderDetailView.as_view(), name='order-detail'),
+    path('checkout/quote/', views.checkout_quote, name='checkout-quote'),
     
     # Wishlist
     path('wishlist/', views.WishlistView.as_view(), name='wishlist'),
@@ -44,7 +49,9 @@ urlpatterns = [
     # Coupons
     path('coupons/', views.CouponListView.as_view(), name='coupon-list'),
     path('coupons/validate/', views.validate_coupon, name='validate-coupon'),
+    path('coupons/best/', views.best_coupon, name='best-coupon'),
     
     # Admin Statistics
     path('admin/stats/', views.admin_stats, name='admin-stats'),
+    path('admin/stats/timeseries/', views.sales_timeseries, name='admin-stats-timeseries'),
 ]
@@ -1,42 +1,115 @@
+from decimal import Decimal, InvalidOperation
+
 from rest_framework import generics, filters, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Prefetch
+from django.conf import settings
+from django.db.models import Q, Prefetch, prefetch_related_objects
 from .models import (
     Category, Product, ProductVariant, Cart, CartItem,
-    Order, OrderItem, ProductReview, Wishlist, WishlistItem, Coupon, UserProfile
+    Order, ProductReview, Wishlist, WishlistItem, Coupon, UserProfile,
+    DailySales, ProductSales, PRODUCT_SORTS,
+)
+from .cache import (
+    CATEGORIES_VERSION, COUPONS_VERSION, PRODUCTS_VERSION,
+    CachedResponseMixin, cache_response, cached_get, cart_version, category_version, product_version,
 )
+from . import carts
+from .checkout import place_order, quote
+from .coupons import coupons
+from .conditional import ConditionalGetMixin, conditional, make_etag, version_validators
+from .facets import compute_facets, get_price_bucket_size
+from .search import search_partitions, search_products_queryset
+from .suggest import suggest, suggestions
+from .pagination import KeysetPagination, get_product_paginator, use_keyset_pagination
 from .serializers import (
     CategorySerializer, ProductSerializer, ProductListSerializer, ProductDetailSerializer,
-    ProductVariantSerializer, CartSerializer, CartItemSerializer,
+    ProductVariantSerializer, CartSerializer, CartItemSerializer, CartBatchSerializer,
     UserSerializer, UserProfileSerializer, ProductReviewSerializer, ProductReviewCreateSerializer,
     OrderSerializer, OrderCreateSerializer, OrderItemSerializer,
     WishlistSerializer, WishlistItemSerializer, CouponSerializer, CouponValidationSerializer
 )
 
 # Category Views
-class CategoryListCreateView(generics.ListCreateAPIView):
+class CategoryListCreateView(ConditionalGetMixin, CachedResponseMixin, generics.ListCreateAPIView):
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]  # Allow public access for browsing
 
-class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
+    def get_cache_versions(self):
+        return [CATEGORIES_VERSION]
+
+class CategoryDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminUser]  # Only admin can modify
 
+    def get_validators(self):
+        updated_at = Category.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None, None
+        return make_etag(self.request, updated_at.isoformat()), updated_at
+
+class CategoryTreeView(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView):
+    """Active category tree, built from one query ordered by materialized path"""
+    queryset = Category.objects.filter(is_active=True)
+    permission_classes = [AllowAny]
+    pagination_class = None
+
+    def get_cache_versions(self):
+        return [CATEGORIES_VERSION]
+
+    # list() rather than get(), which the mixins wrap
+    def list(self, request, *args, **kwargs):
+        categories = self.get_queryset().order_by('path').values(
+            'id', 'name', 'description', 'parent_id', 'depth'
+        )
+        nodes = {}
+        roots = []
+        for category in categories:
+            node = {
+                'id': category['id'],
+                'name': category['name'],
+                'description': category['description'],
+                'depth': category['depth'],
+                'children': [],
+            }
+            parent_id = category['parent_id']
+            if parent_id is None:
+                roots.append(node)
+            elif parent_id in nodes:
+                nodes[parent_id]['children'].append(node)
+            else:
+                continue  # under an inactive category
+            nodes[category['id']] = node
+        return Response(roots)
+
 # Product Views
-class ProductListCreateView(generics.ListCreateAPIView):
-    queryset = Product.objects.filter(is_active=True).select_related('category').prefetch_related('images', 'variants')
+class ProductListCreateView(ConditionalGetMixin, CachedResponseMixin, generics.ListCreateAPIView):
+    queryset = Product.objects.filter(is_active=True).for_listing()
     serializer_class = ProductListSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['name', 'description']
-    ordering_fields = ['name', 'base_price', 'created_at']
+    # Free-text `search` goes through catalog.search; `ordering=-rank` sorts by relevance
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    ordering_fields = ['name', 'base_price', 'min_price', 'average_rating', 'created_at', 'rank']
     ordering = ['-created_at']
     permission_classes = [AllowAny]  # Allow public access for browsing
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = get_product_paginator(self.request)
+        return self._paginator
+
+    def get_cache_versions(self):
+        category = self.request.query_params.get('category')
+        if category:
+            return [category_version(category)]
+        return [PRODUCTS_VERSION]
+
     def get_queryset(self):
         queryset = super().get_queryset()
         category = self.request.query_params.get('category')
@@ -45,67 +118,93 @@ class ProductListCreateView(generics.ListCreateAPIView):
         max_price = self.request.query_params.get('max_price')
 
         if category:
-            queryset = queryset.filter(category_id=category)
-        if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | Q(description__icontains=search)
-            )
-        if min_price:
-            queryset = queryset.filter(base_price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(base_price__lte=max_price)
+            queryset = queryset.in_category(category)
+        queryset = queryset.priced_between(min_price, max_price)
 
-        return queryset
+        return search_products_queryset(queryset, search, include_category=False)
 
-class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.select_related('category').prefetch_related('images', 'variants', 'reviews__user')
+class ProductDetailView(ConditionalGetMixin, CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ProductDetailSerializer
     permission_classes = [AllowAny]  # Allow public access for viewing
 
+    def get_queryset(self):
+        recent_reviews = (
+            ProductReview.objects.select_related('user')
+            .order_by('-created_at', '-id')[:getattr(settings, 'CATALOG_DETAIL_REVIEW_COUNT', 5)]
+        )
+        return Product.objects.select_related('category').prefetch_related(
+            'images', 'variants__shards',
+            Prefetch('reviews', queryset=recent_reviews, to_attr='recent_reviews'),
+        )
+
+    def get_cache_versions(self):
+        return [product_version(self.kwargs['pk'])]
+
 # Product Variant Views
 class ProductVariantListCreateView(generics.ListCreateAPIView):
-    queryset = ProductVariant.objects.filter(is_active=True).select_related('product')
+    queryset = ProductVariant.objects.filter(is_active=True).select_related('product').prefetch_related('shards')
     serializer_class = ProductVariantSerializer
     permission_classes = [AllowAny]  # Allow public access for browsing
 
 class ProductVariantDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = ProductVariant.objects.select_related('product')
+    queryset = ProductVariant.objects.select_related('product').prefetch_related('shards')
     serializer_class = ProductVariantSerializer
     permission_classes = [IsAdminUser]  # Only admin can modify
 
 # Cart Views
+# Anonymous visitors get a cookie cart (request.anonymous_cart, see
+# catalog.middleware) that is merged into their Cart when they log in
 class CartView(generics.RetrieveAPIView):
     serializer_class = CartSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def get_object(self):
-        cart, created = Cart.objects.get_or_create(user=self.request.user)
-        return cart
+        if not self.request.user.is_authenticated:
+            return self.request.anonymous_cart
+        return carts.cart_with_totals(self.request.user)
+
+# Item count and subtotal for header widgets, without loading the lines;
+# cached per user until the cart or any product changes
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def cart_summary(request):
+    if not request.user.is_authenticated:
+        cart = request.anonymous_cart
+        return Response({'total_items': cart.total_items, 'total_price': cart.total_price})
 
+    def render():
+        totals = CartItem.objects.filter(cart__user=request.user).totals()
+        return Response({'total_items': totals['item_count'], 'total_price': totals['subtotal']})
+    return cached_get(request, [cart_version(request.user.pk), PRODUCTS_VERSION], render)
+
+# Cart writes go through catalog.carts, shared with the customer views
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([AllowAny])
 def add_to_cart(request):
     variant_id = request.data.get('variant_id')
     quantity = request.data.get('quantity', 1)
+    if not isinstance(quantity, int) or quantity < 1:
+        return Response({'error': 'Quantity must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
         variant = ProductVariant.objects.get(id=variant_id, is_active=True)
-    except ProductVariant.DoesNotExist:
+    except (ProductVariant.DoesNotExist, ValueError, TypeError):
         return Response({'error': 'Product variant not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    if variant.inventory_count < quantity:
-        return Response({'error': 'Insufficient inventory'}, status=status.HTTP_400_BAD_REQUEST)
+    if not request.user.is_authenticated:
+        try:
+            request.anonymous_cart.apply_operations([(carts.ADD, variant.pk, quantity)])
+        except ValidationError:
+            return Response({'error': 'Insufficient inventory'}, status=status.HTTP_400_BAD_REQUEST)
+        cart_item = CartItem(variant=variant, quantity=request.anonymous_cart.lines[variant.pk])
+        return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
 
     cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        variant=variant,
-        defaults={'quantity': quantity}
-    )
-
-    if not created:
-        cart_item.quantity += quantity
-        cart_item.save()
+    try:
+        cart_item = carts.add_item(cart, variant.pk, quantity)
+    except ValidationError:
+        return Response({'error': 'Insufficient inventory'}, status=status.HTTP_400_BAD_REQUEST)
+    cart_item.variant = variant
 
     return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
 
@@ -113,35 +212,55 @@ def add_to_cart(request):
 @permission_classes([IsAuthenticated])
 def update_cart_item(request, item_id):
     try:
-        cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
+        cart_item = CartItem.objects.select_related('cart', 'variant__product').get(id=item_id, cart__user=request.user)
     except CartItem.DoesNotExist:
         return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
 
     quantity = request.data.get('quantity')
     if quantity is None:
         return Response({'error': 'Quantity is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(quantity, int):
+        return Response({'error': 'Quantity must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
 
+    try:
+        carts.set_item(cart_item.cart, cart_item.variant_id, quantity)
+    except ValidationError:
+        return Response({'error': 'Insufficient inventory'}, status=status.HTTP_400_BAD_REQUEST)
     if quantity <= 0:
-        cart_item.delete()
         return Response({'message': 'Item removed from cart'}, status=status.HTTP_200_OK)
 
-    if cart_item.variant.inventory_count < quantity:
-        return Response({'error': 'Insufficient inventory'}, status=status.HTTP_400_BAD_REQUEST)
-
     cart_item.quantity = quantity
-    cart_item.save()
-
     return Response(CartItemSerializer(cart_item).data)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def remove_from_cart(request, item_id):
     try:
-        cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-        cart_item.delete()
-        return Response({'message': 'Item removed from cart'}, status=status.HTTP_200_OK)
+        cart_item = CartItem.objects.select_related('cart').get(id=item_id, cart__user=request.user)
     except CartItem.DoesNotExist:
         return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
+    carts.set_item(cart_item.cart, cart_item.variant_id, 0)
+    return Response({'message': 'Item removed from cart'}, status=status.HTTP_200_OK)
+
+# Apply several cart line changes in one request, see catalog.carts
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cart_batch(request):
+    serializer = CartBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    operations = [
+        (operation['op'], operation['variant_id'], operation['quantity'])
+        for operation in serializer.validated_data['operations']
+    ]
+
+    if not request.user.is_authenticated:
+        request.anonymous_cart.apply_operations(operations)
+        return Response(CartSerializer(request.anonymous_cart).data)
+
+    cart, created = Cart.objects.get_or_create(user=request.user)
+    carts.apply_operations(cart, operations)
+
+    return Response(CartSerializer(carts.cart_with_totals(request.user)).data)
 
 # Home/API Info View
 @api_view(['GET'])
@@ -170,15 +289,29 @@ def api_info(request):
 # Category Products View
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional(lambda request, category_id: version_validators(request, [category_version(category_id)]))
+@cache_response(lambda request, category_id: [category_version(category_id)])
 def category_products(request, category_id):
     try:
         category = Category.objects.get(id=category_id, is_active=True)
-        products = Product.objects.filter(category=category, is_active=True).select_related('category').prefetch_related('images', 'variants')
+        products = Product.objects.filter(
+            category__path__startswith=category.path, is_active=True
+        ).for_listing()
+
+        if use_keyset_pagination(request):
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(products, request)
+            return Response({
+                'category': CategorySerializer(category).data,
+                'products': ProductListSerializer(page, many=True).data,
+                'next': paginator.get_next_link(),
+            })
+
         serializer = ProductListSerializer(products, many=True)
         return Response({
             'category': CategorySerializer(category).data,
             'products': serializer.data,
-            'count': products.count()
+            'count': len(serializer.data)
         })
     except Category.DoesNotExist:
         return Response({'error': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -195,13 +328,25 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
         return profile
 
 # Product Reviews Views
+REVIEW_SORTS = {
+    'recent': ('-created_at',),
+    'helpful': ('-helpful_votes', '-created_at'),
+}
+
 class ProductReviewListCreateView(generics.ListCreateAPIView):
     serializer_class = ProductReviewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         product_id = self.kwargs.get('product_id')
-        return ProductReview.objects.filter(product_id=product_id).select_related('user')
+        # Both sorts are served by the (product, ...) review indexes
+        ordering = REVIEW_SORTS.get(self.request.query_params.get('sort'), REVIEW_SORTS['recent'])
+        return (
+            ProductReview.objects.filter(product_id=product_id)
+            .select_related('user')
+            .order_by(*ordering)
+        )
     
     def perform_create(self, serializer):
         product_id = self.kwargs.get('product_id')
@@ -221,50 +366,36 @@ class OrderListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related('items__variant__product')
+        return (
+            Order.objects.filter(user=self.request.user)
+            .select_related('user', 'coupon').prefetch_related('items__variant__product')
+        )
     
     def perform_create(self, serializer):
-        # Create order from cart
-        cart = get_object_or_404(Cart, user=self.request.user)
-        cart_items = cart.items.all()
-        
-        if not cart_items.exists():
-            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Generate order number
-        import uuid
-        order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
-        
-        # Calculate total
-        total_amount = sum(item.total_price for item in cart_items)
-        
-        # Create order
-        order = serializer.save(
-            user=self.request.user,
-            order_number=order_number,
-            total_amount=total_amount
-        )
-        
-        # Create order items
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                variant=cart_item.variant,
-                quantity=cart_item.quantity,
-                price=cart_item.variant.final_price
-            )
-        
-        # Clear cart
-        cart.items.all().delete()
-        
-        return order
+        # Create order from cart, see catalog.checkout
+        order = place_order(self.request.user, **serializer.validated_data)
+        prefetch_related_objects([order], 'coupon', 'items__variant__product')
+        serializer.instance = order
 
 class OrderDetailView(generics.RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).prefetch_related('items__variant__product')
+        return (
+            Order.objects.filter(user=self.request.user)
+            .select_related('user', 'coupon').prefetch_related('items__variant__product')
+        )
+
+# Everything the checkout page shows, computed without writing; see
+# catalog.checkout.quote
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def checkout_quote(request):
+    coupon_code = request.query_params.get('coupon_code')
+    if request.user.is_authenticated:
+        return Response(quote(user=request.user, coupon_code=coupon_code))
+    return Response(quote(lines=request.anonymous_cart.lines, coupon_code=coupon_code))
 
 # Wishlist Views
 class WishlistView(generics.RetrieveAPIView):
@@ -273,6 +404,12 @@ class WishlistView(generics.RetrieveAPIView):
     
     def get_object(self):
         wishlist, created = Wishlist.objects.get_or_create(user=self.request.user)
+        prefetch_related_objects([wishlist], Prefetch(
+            'items',
+            queryset=WishlistItem.objects.select_related(
+                'product__category', 'product__primary_image'
+            )
+        ))
         return wishlist
 
 @api_view(['POST'])
@@ -301,9 +438,13 @@ def remove_from_wishlist(request, product_id):
     return Response({'message': 'Product removed from wishlist'}, status=status.HTTP_200_OK)
 
 # Coupon Views
-class CouponListView(generics.ListAPIView):
+class CouponListView(CachedResponseMixin, generics.ListAPIView):
     serializer_class = CouponSerializer
     permission_classes = [AllowAny]
+    cache_timeout = 60  # validity windows open and close without a write
+
+    def get_cache_versions(self):
+        return [COUPONS_VERSION]
     
     def get_queryset(self):
         from django.utils import timezone
@@ -314,41 +455,47 @@ class CouponListView(generics.ListAPIView):
             valid_until__gte=now
         )
 
+# Coupons are looked up in the in-process coupon book, see catalog.coupons
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def validate_coupon(request):
     serializer = CouponValidationSerializer(data=request.data)
-    if serializer.is_valid():
-        code = serializer.validated_data['code']
-        order_amount = serializer.validated_data['order_amount']
-        
-        try:
-            coupon = Coupon.objects.get(code=code)
-            if coupon.is_valid and order_amount >= coupon.min_order_amount:
-                discount_amount = 0
-                if coupon.discount_type == 'percentage':
-                    discount_amount = (order_amount * coupon.discount_value) / 100
-                else:
-                    discount_amount = coupon.discount_value
-                
-                return Response({
-                    'valid': True,
-                    'discount_amount': discount_amount,
-                    'discount_type': coupon.discount_type,
-                    'discount_value': coupon.discount_value
-                })
-            else:
-                return Response({
-                    'valid': False,
-                    'error': 'Coupon is not valid or minimum order amount not met'
-                })
-        except Coupon.DoesNotExist:
-            return Response({
-                'valid': False,
-                'error': 'Invalid coupon code'
-            })
-    
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    coupon = coupons.get(serializer.validated_data['code'])
+    if coupon is None:
+        return Response({
+            'valid': False,
+            'error': 'Invalid coupon code'
+        })
+    discount_amount = coupon.discount(serializer.validated_data['order_amount'])
+    if not discount_amount:
+        return Response({
+            'valid': False,
+            'error': 'Coupon is not valid or minimum order amount not met'
+        })
+    return Response({
+        'valid': True,
+        'discount_amount': discount_amount,
+        'discount_type': coupon.discount_type,
+        'discount_value': coupon.discount_value
+    })
+
+# The coupon giving the largest discount on the current cart
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def best_coupon(request):
+    if request.user.is_authenticated:
+        subtotal = CartItem.objects.filter(cart__user=request.user).totals()['subtotal']
+    else:
+        subtotal = request.anonymous_cart.total_price
+    coupon, discount_amount = coupons.best(subtotal)
+    return Response({
+        'code': coupon.code if coupon else None,
+        'discount_amount': discount_amount,
+        'order_amount': subtotal,
+    })
 
 # Search and Filter Views
 @api_view(['GET'])
@@ -361,65 +508,103 @@ def search_products(request):
     rating = request.GET.get('rating', '')
     sort_by = request.GET.get('sort', '-created_at')
     
-    products = Product.objects.filter(is_active=True).select_related('category').prefetch_related('images', 'variants', 'reviews')
-    
-    if query:
-        products = products.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        )
+    products = Product.objects.filter(is_active=True).for_listing()
     
     if category:
-        products = products.filter(category_id=category)
+        products = products.in_category(category)
     
-    if min_price:
-        products = products.filter(base_price__gte=min_price)
-    
-    if max_price:
-        products = products.filter(base_price__lte=max_price)
+    products = products.priced_between(min_price, max_price)
     
     if rating:
-        products = products.filter(reviews__rating__gte=rating).distinct()
+        # Minimum average rating, read from the maintained summary column
+        try:
+            rating = Decimal(rating)
+        except InvalidOperation:
+            rating = None
+        # Decimal also parses nan and inf, which the database can't compare
+        if rating is None or not rating.is_finite() or not 0 <= rating <= 5:
+            return Response({'rating': 'Must be a number from 0 to 5'}, status=status.HTTP_400_BAD_REQUEST)
+        products = products.filter(average_rating__gte=rating)
     
-    products = products.order_by(sort_by)
+    if sort_by not in PRODUCT_SORTS:
+        return Response(
+            {'sort': f'Unsupported sort; choose one of {", ".join(PRODUCT_SORTS)}'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # ?facets=1 adds the filter sidebar counts for the whole result set,
+    # which the search backend may cap
+    facets = None
+    if request.GET.get('facets') in ('1', 'true'):
+        price_bucket = get_price_bucket_size(request.GET.get('price_bucket'))
+        facets = compute_facets(search_partitions(products, query), price_bucket)
+
+    # Search after the filters, so a capped backend caps filtered matches
+    products = search_products_queryset(products, query).sorted_by(sort_by)
+
+    if use_keyset_pagination(request):
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(products, request)
+        response = paginator.get_paginated_response(ProductListSerializer(page, many=True).data)
+        if facets is not None:
+            response.data['facets'] = facets
+        return response
     
     serializer = ProductListSerializer(products, many=True)
+    if facets is not None:
+        return Response({'results': serializer.data, 'facets': facets})
     return Response(serializer.data)
 
+# Typeahead for the storefront search box; kept lean for per-keystroke use
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+@renderer_classes([JSONRenderer])
+def suggest_products(request):
+    prefix = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), suggestions.limit)
+    except ValueError:
+        limit = 8
+    if not prefix:
+        return Response({'products': [], 'categories': []})
+    return Response(suggest(prefix, limit))
+
 # Statistics Views
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def admin_stats(request):
-    from django.db.models import Count, Sum, Avg
+    from django.contrib.auth.models import User
+    from django.db.models import Count, Sum
     from django.utils import timezone
     from datetime import timedelta
     
     # Basic stats
     total_products = Product.objects.count()
     total_categories = Category.objects.count()
-    total_orders = Order.objects.count()
     total_users = User.objects.count()
     
-    # Recent orders (last 30 days)
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_orders = Order.objects.filter(created_at__gte=thirty_days_ago).count()
-    
-    # Revenue stats
-    total_revenue = Order.objects.aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    monthly_revenue = Order.objects.filter(
-        created_at__gte=thirty_days_ago
-    ).aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    # Order and revenue stats come from the daily rollups (catalog.rollups),
+    # plus the few (recent) orders not rolled up yet, so their cost does not grow
+    # with order history. "Recent" is the last 30 calendar days.
+    thirty_days_ago = timezone.localdate() - timedelta(days=30)
+    rolled_up = DailySales.objects.aggregate(
+        total_orders=Sum('order_count'),
+        total_revenue=Sum('revenue'),
+        recent_orders=Sum('order_count', filter=Q(date__gte=thirty_days_ago)),
+        recent_revenue=Sum('revenue', filter=Q(date__gte=thirty_days_ago)),
+    )
+    pending = Order.objects.filter(is_rolled_up=False).aggregate(
+        orders=Count('id'),
+        revenue=Sum('total_amount'),
+    )
+    total_orders = (rolled_up['total_orders'] or 0) + pending['orders']
+    recent_orders = (rolled_up['recent_orders'] or 0) + pending['orders']
+    total_revenue = (rolled_up['total_revenue'] or 0) + (pending['revenue'] or 0)
+    monthly_revenue = (rolled_up['recent_revenue'] or 0) + (pending['revenue'] or 0)
     
     # Top products
-    top_products = Product.objects.annotate(
-        order_count=Count('variants__orderitem__order')
-    ).order_by('-order_count')[:5]
+    top_products = ProductSales.objects.select_related('product').order_by('-order_count')[:5]
     
     return Response({
         'total_products': total_products,
@@ -431,13 +616,65 @@ def admin_stats(request):
         'monthly_revenue': float(monthly_revenue),
         'top_products': [
             {
-                'id': product.id,
-                'name': product.name,
-                'order_count': product.order_count
+                'id': sales.product.id,
+                'name': sales.product.name,
+                'order_count': sales.order_count
             }
-            for product in top_products
+            for sales in top_products
         ]
     })
 
+def _parse_moment(value, name):
+    from datetime import datetime, time
+    from django.utils import timezone
+    from django.utils.dateparse import parse_date, parse_datetime
+
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time())
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({name: 'Expected an ISO 8601 date or datetime'})
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_timeseries(request):
+    """
+    Orders, units and revenue per hour, day or week between ?start= and
+    ?end= (ISO dates or datetimes; the last 30 days by default), optionally
+    broken down with ?group_by=product|category (top ?limit= by revenue) or
+    restricted to ?product= or ?category=.
+    """
+    from datetime import timedelta
+    from django.utils import timezone
+    from . import analytics
+
+    interval = request.GET.get('interval', analytics.DAY)
+    if interval not in analytics.INTERVALS:
+        raise ValidationError({'interval': f'Expected one of {", ".join(analytics.INTERVALS)}'})
+    group = request.GET.get('group_by') or None
+    if group is not None and group not in analytics.GROUPS:
+        raise ValidationError({'group_by': f'Expected one of {", ".join(analytics.GROUPS)}'})
+    end = _parse_moment(request.GET['end'], 'end') if request.GET.get('end') else timezone.now()
+    start = _parse_moment(request.GET['start'], 'start') if request.GET.get('start') else end - timedelta(days=30)
+    if start >= end:
+        raise ValidationError({'start': 'Must be before end'})
+    if analytics.bucket_count(interval, *analytics.bucket_range(interval, start, end)) > analytics.max_buckets():
+        raise ValidationError({'start': 'Range too long for this interval'})
+    try:
+        product = int(request.GET['product']) if request.GET.get('product') else None
+        category = int(request.GET['category']) if request.GET.get('category') else None
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+    except ValueError:
+        raise ValidationError({'detail': 'product, category and limit must be integers'})
+
+    return Response(analytics.sales_timeseries(
+        interval, start, end, group=group, product=product, category=category, limit=limit,
+    ))
+
 # Import get_object_or_404
 from django.shortcuts import get_object_or_404
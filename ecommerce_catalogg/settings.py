@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'catalog.middleware.AnonymousCartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -152,6 +153,37 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cache
+# Cached catalog responses and the version keys that invalidate them must be
+# shared by every worker, so the default is never per-process local memory:
+# Redis when REDIS_URL is set (needs the redis package), otherwise files,
+# which the workers on one host share. The file cache counts and culls its
+# entries by scanning the directory, so it suits development and single-host
+# deployments; set REDIS_URL in production.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / '.cache',
+            'OPTIONS': {
+                # Django's default of 300 entries is far fewer than one page
+                # per product; past the limit, cull a third of the entries
+                'MAX_ENTRIES': 20000,
+                'CULL_FREQUENCY': 3,
+            },
+        }
+    }
+
+CATALOG_CACHE_TIMEOUT = 300  # seconds
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",